@@ -0,0 +1,5 @@
+"""Offline microbenchmarks of the seqflask hot paths.
+
+python -m benchmarks run -o results.json
+python -m benchmarks compare baseline.json results.json
+"""
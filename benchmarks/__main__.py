@@ -0,0 +1,73 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.runner import (
+    compare_results,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Offline seqflask microbenchmarks"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run benchmarks and store JSON results")
+    run.add_argument("-o", "--output", help="JSON file for the results")
+    run.add_argument("-k", "--filter", help="Only benchmarks matching this regex")
+    run.add_argument(
+        "-q", "--quick", action="store_true", help="Skip 1 Mb and 10,000 record inputs"
+    )
+    run.add_argument(
+        "--min-time", type=float, default=0.2, help="Seconds spent per benchmark"
+    )
+
+    compare = commands.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline", help="JSON results to compare against")
+    compare.add_argument("current", help="JSON results of the change")
+    compare.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as regression (default 0.1)",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    options = parse_options()
+
+    if options.command == "run":
+        results = run_benchmarks(
+            options.filter, quick=options.quick, min_time=options.min_time
+        )
+        if options.output:
+            save_results(results, options.output)
+        return 0
+
+    rows = compare_results(
+        load_results(options.baseline),
+        load_results(options.current),
+        threshold=options.threshold,
+    )
+    for key, before, after, ratio, status in rows:
+        marker = {"regression": "!!", "improvement": "++"}.get(status, "  ")
+        print(
+            f"{marker} {key:<72} {before * 1000:>11.3f} -> {after * 1000:>11.3f} ms"
+            f" ({ratio:.2f}x)"
+        )
+    regressions = sum(row[4] == "regression" for row in rows)
+    print(f"{len(rows)} compared, {regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# cSpell: disable
+import os
+import numpy
+from flask import Flask
+from seqflask.utils import GlobalVariables, fasta_parser
+from seqflask.tables import CodonTableRegistry, load_codon_table
+from seqflask.modules import Nucleotide, Protein, harmonize_many, translate_many
+from seqflask.generator.utils import random_dna
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+FIXTURE = os.path.join(DATA, "codon_tables.spsum")
+
+# Organisms of the bundled fixture
+ORGANISMS = ("284591", "3702", "4577", "180454")
+
+SIZES = (100, 10_000, 1_000_000)
+RECORDS = (1, 100, 10_000)
+QUICK_SIZES = (100, 10_000)
+QUICK_RECORDS = (1, 100)
+
+SENSE_CODONS = [
+    codon
+    for codon, amino in zip(
+        GlobalVariables.CODONS, GlobalVariables.STANDARD_GENETIC_CODE
+    )
+    if amino != "*"
+]
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+CASES = []
+
+
+def case(name):
+    """Registers a benchmark. The decorated function takes the quick flag and
+    yields (params, setup) pairs, where setup builds the inputs of one run and
+    returns the timed callable."""
+
+    def register(function):
+        CASES.append((name, function))
+        return function
+
+    return register
+
+
+def tables():
+    return CodonTableRegistry(FIXTURE, os.path.join(DATA, "missing.spsum"))
+
+
+def app_with(registry):
+    """Bare app (no server) holding the fixture registry and a plot store"""
+    app = Flask("benchmarks")
+    app.config["PLOT_CACHE_SIZE"] = 1 << 20
+    app.extensions["codon_tables"] = registry
+    return app
+
+
+def random_cds(rng, bases):
+    """Random CDS of about bases length: ATG, sense codons and TAA"""
+    middle = rng.integers(len(SENSE_CODONS), size=max(bases // 3 - 2, 0))
+    return "ATG" + "".join(SENSE_CODONS[i] for i in middle.tolist()) + "TAA"
+
+
+def random_protein(rng, residues):
+    middle = rng.integers(len(RESIDUES), size=max(residues - 2, 0))
+    return "M" + "".join(RESIDUES[i] for i in middle.tolist()) + "*"
+
+
+def grid(quick, records=True):
+    """Graded (bases, records) pairs: growing sequence lengths of one record and
+    growing numbers of 1 kb records"""
+    sizes, counts = (QUICK_SIZES, QUICK_RECORDS) if quick else (SIZES, RECORDS)
+    pairs = [(bases, 1) for bases in sizes]
+    if records:
+        pairs += [(1000, count) for count in counts if count > 1]
+    return pairs
+
+
+@case("translate")
+def translate_cases(quick):
+    for bases, records in grid(quick):
+
+        def setup(bases=bases, records=records):
+            rng = numpy.random.default_rng(bases + records)
+            table = tables().get(ORGANISMS[0])[0]
+            sequences = [
+                Nucleotide(f"seq{n}", random_cds(rng, bases)) for n in range(records)
+            ]
+            if records == 1:
+                return lambda: sequences[0].translate(table=table)
+            return lambda: translate_many(sequences, table=table)
+
+        yield {"bases": bases, "records": records}, setup
+
+
+@case("reverse_translate")
+def reverse_translate_cases(quick):
+    for bases, records in grid(quick):
+        for organism in ORGANISMS if bases == 10_000 else ORGANISMS[:1]:
+
+            def setup(bases=bases, records=records, organism=organism):
+                rng = numpy.random.default_rng(bases + records)
+                table = tables().get(organism)[0]
+                proteins = [
+                    Protein(f"seq{n}", random_protein(rng, bases // 3))
+                    for n in range(records)
+                ]
+                return lambda: [p.reverse_translate(table=table) for p in proteins]
+
+            yield {"bases": bases, "records": records, "organism": organism}, setup
+
+
+@case("harmonize")
+def harmonize_cases(quick):
+    pairs = list(zip(ORGANISMS, ORGANISMS[1:] + ORGANISMS[:1]))
+    for bases, records in grid(quick):
+        for source, target in pairs if bases == 10_000 else pairs[:1]:
+
+            def setup(bases=bases, records=records, source=source, target=target):
+                rng = numpy.random.default_rng(bases + records)
+                registry = tables()
+                source_table = registry.get(source)[0]
+                table = registry.get(target)[0]
+                sequences = [
+                    Nucleotide(f"seq{n}", random_cds(rng, bases))
+                    for n in range(records)
+                ]
+                return lambda: harmonize_many(
+                    sequences, source=source_table, table=table
+                )
+
+            params = {"bases": bases, "records": records}
+            yield dict(params, source=source, organism=target), setup
+
+
+@case("remove_cutsites")
+def remove_cutsites_cases(quick):
+    for bases, records in grid(quick):
+
+        def setup(bases=bases, records=records):
+            rng = numpy.random.default_rng(bases + records)
+            table = tables().get(ORGANISMS[0])[0]
+            # One BsaI and one BsmBI site per kilobase on top of random ones
+            sequences = []
+            for n in range(records):
+                cds = random_cds(rng, bases)
+                for position in range(501, len(cds) - 12, 1002):
+                    cds = cds[:position] + "GGTCTCCGTCTC" + cds[position + 12 :]
+                sequences.append(Nucleotide(f"seq{n}", cds))
+            return lambda: [single.remove_cutsites(table=table) for single in sequences]
+
+        yield {"bases": bases, "records": records}, setup
+
+
+@case("plot_codon_usage")
+def plot_codon_usage_cases(quick):
+    for bases, records in grid(quick):
+        for organism in ORGANISMS if bases == 10_000 else ORGANISMS[:1]:
+
+            def setup(bases=bases, records=records, organism=organism):
+                rng = numpy.random.default_rng(bases + records)
+                app = app_with(tables())
+                table = app.extensions["codon_tables"].get(organism)[0]
+                sequences = [
+                    Nucleotide(f"seq{n}", random_cds(rng, bases))
+                    for n in range(records)
+                ]
+
+                def run():
+                    # Profiles are cached by content, so every run starts empty
+                    with app.app_context():
+                        app.extensions.pop("plots", None)
+                        for single in sequences:
+                            single.plot_codon_usage(table=table)
+
+                return run
+
+            yield {"bases": bases, "records": records, "organism": organism}, setup
+
+
+@case("load_codon_table")
+def load_codon_table_cases(quick):
+    for cached in (False, True):
+
+        def setup(cached=cached):
+            app = app_with(tables())
+
+            def run():
+                with app.app_context():
+                    if not cached:
+                        app.extensions["codon_tables"] = tables()
+                    for organism in ORGANISMS:
+                        load_codon_table(taxonomy_id=organism)
+
+            return run
+
+        yield {"organisms": len(ORGANISMS), "cached": cached}, setup
+
+
+@case("fasta_parser")
+def fasta_parser_cases(quick):
+    for bases, records in grid(quick):
+
+        def setup(bases=bases, records=records):
+            rng = numpy.random.default_rng(bases + records)
+            lines = []
+            for n in range(records):
+                cds = random_cds(rng, bases)
+                lines.append(f">seq{n} synthetic")
+                lines.extend(cds[i : i + 60] for i in range(0, len(cds), 60))
+            text = "\n".join(lines) + "\n"
+            return lambda: fasta_parser(text)
+
+        yield {"bases": bases, "records": records}, setup
+
+
+@case("random_dna")
+def random_dna_cases(quick):
+    for bases, _ in grid(quick, records=False):
+        for restriction in (False, True):
+
+            def setup(bases=bases, restriction=restriction):
+                rng = numpy.random.default_rng(bases)
+                return lambda: random_dna(bases, restriction=restriction, rng=rng)
+
+            yield {"bases": bases, "restriction": restriction}, setup
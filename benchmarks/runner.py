@@ -0,0 +1,107 @@
+import re
+import sys
+import json
+import time
+import platform
+import subprocess
+import numpy
+from benchmarks.cases import CASES
+
+
+def benchmark_name(name, params):
+    """Stable result key, e.g. translate[bases=100,records=1]"""
+    return f"{name}[{','.join(f'{key}={value}' for key, value in params.items())}]"
+
+
+def measure(function, min_time=0.2, max_repeats=50):
+    """Times function after a warm-up call until min_time is spent or
+    max_repeats calls were made. Calls slower than min_time run once."""
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    if first >= min_time:
+        return [first]
+
+    times, total = [], 0.0
+    while total < min_time and len(times) < max_repeats:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+        total += times[-1]
+    return times
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "revision": revision,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def run_benchmarks(pattern=None, quick=False, min_time=0.2, log=sys.stderr):
+    """Runs every benchmark whose name matches pattern (a regular expression).
+    Returns a JSON-ready dict with the environment and one entry per run."""
+    results = {}
+    for name, cases in CASES:
+        for params, setup in cases(quick):
+            key = benchmark_name(name, params)
+            if pattern and not re.search(pattern, key):
+                continue
+
+            times = measure(setup(), min_time=min_time)
+            results[key] = {
+                "name": name,
+                "params": params,
+                "repeats": len(times),
+                "min": min(times),
+                "median": float(numpy.median(times)),
+                "mean": float(numpy.mean(times)),
+            }
+            if log:
+                print(f"{key:<72} {results[key]['median'] * 1000:>11.3f} ms", file=log)
+
+    return {"environment": environment(), "quick": quick, "results": results}
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Compares the fastest times (the least noisy statistic) of benchmarks
+    present in both result sets. Returns a list of (key, baseline, current,
+    ratio, status) where status is "regression" or "improvement" beyond
+    threshold, otherwise "same"."""
+    rows = []
+    for key, entry in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+        before, after = baseline["results"][key]["min"], entry["min"]
+        ratio = after / before if before else float("inf")
+        status = "same"
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        rows.append((key, before, after, ratio, status))
+    return rows
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_results(results, path):
+    with open(path, "w") as handle:
+        json.dump(results, handle, indent=2)
+        handle.write("\n")
@@ -17,3 +17,54 @@ class Config:
     # Static assets
     STATIC_FOLDER = "static"
     TEMPLATES_FOLDER = "templates"
+
+    # Codon usage tables; CODON_DATABASE defaults to seqflask/data/codon_usage.db
+    # (built with `flask tables build`)
+    CODON_TABLE_CACHE_SIZE = int(environ.get("CODON_TABLE_CACHE_SIZE", 64))
+    CODON_DATABASE = environ.get("CODON_DATABASE")
+
+    # Plots kept in memory and, for all workers, as files in PLOT_DIRECTORY
+    # (defaults to instance/plots); "client" draws them in the browser and
+    # renders images only for export, "server" always shows rendered images
+    PLOT_CACHE_SIZE = int(environ.get("PLOT_CACHE_SIZE", 256))
+    PLOT_DIRECTORY = environ.get("PLOT_DIRECTORY")
+    PLOT_STORE_SIZE = int(environ.get("PLOT_STORE_SIZE", 10000))
+    PLOT_RENDERING = environ.get("PLOT_RENDERING", "client")
+
+    # Beam width of the DNA optimizer; 0 samples every codon on its own unless
+    # the form asks for the penalized search (or the API for a beam_width)
+    OPTIMIZER_BEAM_WIDTH = int(environ.get("OPTIMIZER_BEAM_WIDTH", 0))
+
+    # Target Tm (°C) of primers designed for GoldenGate parts
+    PRIMER_TARGET_TM = float(environ.get("PRIMER_TARGET_TM", 60))
+
+    # Most bases the generator makes per request
+    GENERATOR_MAX_BASES = int(environ.get("GENERATOR_MAX_BASES", 2000000))
+
+    # Request timings and counters served at /metrics, added up over all
+    # workers from their files in METRICS_DIRECTORY (defaults to instance/metrics)
+    METRICS_ENABLED = bool(int(environ.get("METRICS_ENABLED", 1)))
+    METRICS_DIRECTORY = environ.get("METRICS_DIRECTORY")
+
+    # Load codon tables, pandas and matplotlib before serving (see gunicorn.conf.py)
+    STARTUP_WARM_UP = bool(int(environ.get("STARTUP_WARM_UP", 1)))
+
+    # UniProt entries are fetched in batches and cached on disk for
+    # UNIPROT_CACHE_TTL seconds (UNIPROT_CACHE_DIR defaults to instance/uniprot)
+    UNIPROT_BASE_URL = environ.get("UNIPROT_BASE_URL", "https://rest.uniprot.org")
+    UNIPROT_CACHE_DIR = environ.get("UNIPROT_CACHE_DIR")
+    UNIPROT_CACHE_TTL = int(environ.get("UNIPROT_CACHE_TTL", 7 * 24 * 3600))
+    UNIPROT_TIMEOUT = float(environ.get("UNIPROT_TIMEOUT", 10))
+    UNIPROT_WORKERS = int(environ.get("UNIPROT_WORKERS", 4))
+
+    # Results of deterministic operations kept in memory (0 turns the cache off)
+    # and, with MEMO_DATABASE, in a SQLite file shared by workers and restarts
+    MEMO_CACHE_SIZE = int(environ.get("MEMO_CACHE_SIZE", 1024))
+    MEMO_DATABASE = environ.get("MEMO_DATABASE")
+
+    # Background jobs; JOB_WORKERS=0 leaves them to `flask jobs work`. Running
+    # jobs without a heartbeat for JOB_TIMEOUT seconds are queued again
+    JOB_DATABASE = environ.get("JOB_DATABASE")
+    JOB_WORKERS = int(environ.get("JOB_WORKERS", 2))
+    JOB_RETENTION = int(environ.get("JOB_RETENTION", 100))
+    JOB_TIMEOUT = int(environ.get("JOB_TIMEOUT", 60))
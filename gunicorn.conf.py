@@ -0,0 +1,37 @@
+"""Gunicorn settings, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`"""
+from os import environ, path
+
+workers = int(environ.get("WEB_CONCURRENCY", 2))
+threads = int(environ.get("GUNICORN_THREADS", 1))
+
+# Import the app once in the master; forked workers share its modules, mapped
+# codon tables and warm caches copy-on-write instead of each loading them
+preload_app = bool(int(environ.get("GUNICORN_PRELOAD", 1)))
+
+
+def on_starting(server):
+    """Metrics of workers of an earlier run are not part of this one"""
+    from seqflask.instrumentation import clear_directory
+
+    # Same default as the app's, instance/ next to the seqflask package
+    clear_directory(
+        environ.get("METRICS_DIRECTORY")
+        or path.join(path.dirname(path.abspath(__file__)), "instance", "metrics")
+    )
+
+
+def when_ready(server):
+    """Warms the preloaded app before the first worker is forked"""
+    if not preload_app:
+        return
+
+    from wsgi import app
+    from seqflask.startup import warm_up
+
+    steps = warm_up(app)
+    if steps:
+        server.log.info(
+            "Warmed up in %.2f s (%s)",
+            sum(steps.values()),
+            ", ".join(f"{step} {seconds:.2f} s" for step, seconds in steps.items()),
+        )
@@ -1,6 +1,8 @@
 """Initialize Flask app"""
 from flask import Flask
 
+__version__ = "0.1.0"
+
 
 def create_app():
     """Initialize the core application."""
@@ -13,13 +15,31 @@ def create_app():
         from seqflask.protein.routes import protein
         from seqflask.generator.routes import generator
         from seqflask.main.routes import main
+        from seqflask.plots.routes import plots
+        from seqflask.api.routes import api
         from seqflask.errors.handlers import errors
+        from seqflask.tables import codon_tables, tables_cli
+        from seqflask.jobs import jobs_cli
+        from seqflask.startup import startup_cli
+        from seqflask import instrumentation
 
         # Register blueprints
         app.register_blueprint(dna)
         app.register_blueprint(protein)
         app.register_blueprint(generator)
         app.register_blueprint(main)
+        app.register_blueprint(plots)
+        app.register_blueprint(api)
         app.register_blueprint(errors)
 
+        # Stage timings and counters, served at /metrics
+        instrumentation.init_app(app)
+
+        app.cli.add_command(jobs_cli)
+        app.cli.add_command(tables_cli)
+        app.cli.add_command(startup_cli)
+
+        # Map or index codon usage tables once per process
+        codon_tables(app).prepare()
+
         return app
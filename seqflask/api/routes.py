@@ -0,0 +1,146 @@
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    jsonify,
+    request,
+    stream_with_context,
+    url_for,
+)
+from seqflask.utils import FastaError, iter_fasta
+from seqflask.tables import codon_tables, load_codon_table
+from seqflask.jobs import FINISHED, job_queue
+from seqflask.instrumentation import label_request
+from seqflask.memo import result_cache
+from seqflask.api.utils import (
+    API_DNA_OPERATIONS,
+    FASTA_MIMETYPES,
+    make_annotator,
+    make_processor,
+    parse_request,
+    stream_results,
+)
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(405)
+@api.errorhandler(409)
+def api_error(error):
+    return jsonify(error=error.description), error.code
+
+
+def json_payload():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        abort(400, "Request body must be a JSON object")
+    return payload
+
+
+def request_options(kind, operation):
+    """Validated options of a JSON request or of a raw FASTA body (with options in
+    the query string), whose records are parsed lazily while streaming"""
+    if request.mimetype not in FASTA_MIMETYPES:
+        return parse_request(kind, operation, json_payload())
+
+    payload = request.args.to_dict()
+    for flag in ("maximize", "primers", "metrics"):
+        payload[flag] = payload.get(flag, "").lower() in ("1", "true", "yes")
+    return parse_request(kind, operation, payload, records=iter_fasta(request.stream))
+
+
+def stream_response(options):
+    label_request(operation=options["operation"], organism=options["target_organism"])
+    load_table = lambda taxid: load_codon_table(taxonomy_id=taxid)
+    sequence_type, process = make_processor(options, load_table, result_cache())
+    return Response(
+        stream_with_context(
+            stream_results(
+                options["records"],
+                sequence_type,
+                process,
+                make_annotator(options, load_table),
+            )
+        ),
+        mimetype="application/x-ndjson",
+    )
+
+
+def submit_job(options):
+    try:
+        options["records"] = list(options["records"])
+    except FastaError as e:
+        abort(400, str(e))
+    if not options["records"]:
+        abort(400, "Nothing to do here: the FASTA has no records")
+
+    job_id = job_queue().submit(options)
+    response = jsonify(job_queue().status(job_id))
+    response.status_code = 202
+    response.headers["Location"] = url_for("api.job_status", job_id=job_id)
+    return response
+
+
+@api.route("/organisms")
+def organisms():
+    return jsonify(
+        organisms=[
+            {"taxid": taxid, "species": species}
+            for taxid, species in codon_tables().organisms()
+        ]
+    )
+
+
+@api.route("/dna/<operation>", methods=["POST"])
+def dna_api(operation):
+    if operation not in API_DNA_OPERATIONS:
+        abort(404, f"Unknown operation: {operation}")
+
+    options = request_options("dna", operation)
+    return stream_response(options)
+
+
+@api.route("/protein/reverse-translate", methods=["POST"])
+def protein_api():
+    options = request_options("protein", "reverse-translate")
+    return stream_response(options)
+
+
+@api.route("/jobs/dna/<operation>", methods=["POST"])
+def dna_job(operation):
+    if operation not in API_DNA_OPERATIONS:
+        abort(404, f"Unknown operation: {operation}")
+
+    options = request_options("dna", operation)
+    return submit_job(options)
+
+
+@api.route("/jobs/protein/reverse-translate", methods=["POST"])
+def protein_job():
+    options = request_options("protein", "reverse-translate")
+    return submit_job(options)
+
+
+@api.route("/jobs/<job_id>")
+def job_status(job_id):
+    status = job_queue().status(job_id)
+    if status is None:
+        abort(404, f"Unknown job: {job_id}")
+
+    status["result_url"] = url_for("api.job_result", job_id=job_id)
+    return jsonify(status)
+
+
+@api.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    status = job_queue().status(job_id)
+    if status is None:
+        abort(404, f"Unknown job: {job_id}")
+    if status["status"] not in FINISHED:
+        abort(409, f"Job is {status['status']}")
+    if status["status"] == "failed":
+        abort(409, f"Job failed: {status['error']}")
+
+    return Response(job_queue().result(job_id), mimetype="application/x-ndjson")
@@ -0,0 +1,197 @@
+import json
+from flask import abort, current_app
+from seqflask.utils import FastaError, GlobalVariables, iter_fasta
+from seqflask.tables import codon_tables
+from seqflask.modules import Nucleotide, Protein
+from seqflask.dna.utils import run_dna_operation
+from seqflask.protein.utils import run_protein_operation
+
+API_DNA_OPERATIONS = ("translate", "optimize", "harmonize", "remove", "part")
+
+# Request bodies read as (optionally compressed) FASTA instead of JSON
+FASTA_MIMETYPES = (
+    "text/plain",
+    "text/x-fasta",
+    "application/octet-stream",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+)
+
+
+def parse_records(payload):
+    """Returns a list of (sequence_id, sequence) from "records" and/or "fasta"
+    of a JSON payload"""
+    records = []
+    for n, record in enumerate(payload.get("records") or []):
+        if not isinstance(record, dict) or not record.get("sequence"):
+            abort(400, f"Record {n} has no sequence")
+        records.append(
+            (str(record.get("id") or f"seq{n + 1}"), str(record["sequence"]).strip())
+        )
+    if payload.get("fasta"):
+        try:
+            records.extend(iter_fasta(str(payload["fasta"])))
+        except FastaError as e:
+            abort(400, str(e))
+    if not records:
+        abort(400, 'Nothing to do here: send "records" or "fasta"')
+
+    return records
+
+
+def parse_organism(payload, key, default=None):
+    """Returns the taxonomy id given by payload[key] if its table is known"""
+    taxonomy_id = str(payload.get(key) or default or "")
+    if not taxonomy_id or taxonomy_id not in codon_tables():
+        abort(400, f"Unknown {key}: {taxonomy_id or None}")
+
+    return taxonomy_id
+
+
+def parse_golden_gate(payload, allowed=None):
+    golden_gate = payload.get("golden_gate")
+    if golden_gate in (None, "", "0000"):
+        return None
+    if golden_gate not in (allowed or GlobalVariables.GGA_PART_TYPES):
+        abort(400, f"Unknown golden_gate part type: {golden_gate}")
+
+    return golden_gate
+
+
+def parse_beam_width(payload):
+    beam_width = payload.get("beam_width")
+    if beam_width in (None, ""):
+        return current_app.config["OPTIMIZER_BEAM_WIDTH"]
+    if isinstance(beam_width, str) and beam_width.isdigit():
+        beam_width = int(beam_width)
+    if type(beam_width) is not int or not 0 <= beam_width <= 64:
+        abort(400, "beam_width must be an integer from 0 to 64")
+
+    return beam_width
+
+
+def parse_request(kind, operation, payload, records=None):
+    """Validates a DNA or protein API request. Returns plain options describing
+    the work, so it can also be stored as a job. Records (e.g. a lazy FASTA
+    stream) are taken from the payload if not given."""
+    options = {
+        "kind": kind,
+        "operation": operation,
+        "records": parse_records(payload) if records is None else records,
+        "target_organism": parse_organism(payload, "target_organism", "284591"),
+        "source_organism": None,
+        "maximize": bool(payload.get("maximize")),
+        "primer_tm": None,
+        "metrics": bool(payload.get("metrics")),
+    }
+    if payload.get("primers"):
+        options["primer_tm"] = current_app.config["PRIMER_TARGET_TM"]
+    if kind == "dna":
+        options["beam_width"] = parse_beam_width(payload)
+        if operation == "harmonize":
+            options["source_organism"] = parse_organism(payload, "source_organism")
+        options["golden_gate"] = parse_golden_gate(payload)
+        if operation == "part" and options["golden_gate"] is None:
+            abort(400, "Operation part needs golden_gate")
+    else:
+        options["golden_gate"] = parse_golden_gate(
+            payload, allowed=[k for k in GlobalVariables.GGA_PART_TYPES if "3" in k]
+        )
+
+    return options
+
+
+def make_processor(options, load_table, cache=None):
+    """Returns (sequence_type, process) that runs single records through the
+    operation of request options; process returns the result and the result
+    before it was made into a part. load_table maps a taxonomy id to a table;
+    cache is an optional seqflask.memo.ResultCache."""
+    table = load_table(options["target_organism"])
+    source = None
+    if options["source_organism"]:
+        source = load_table(options["source_organism"])
+
+    if options["kind"] == "dna":
+
+        def process(single):
+            modified, recoded = run_dna_operation(
+                [single],
+                options["operation"],
+                table=table,
+                source=source,
+                maximize=options["maximize"],
+                golden_gate=options["golden_gate"],
+                beam_width=options.get("beam_width", 0),
+                cache=cache,
+            )
+            return modified[0], recoded[0]
+
+        return Nucleotide, process
+
+    def process(single):
+        modified, recoded = run_protein_operation(
+            [single],
+            table=table,
+            maximize=options["maximize"],
+            golden_gate=options["golden_gate"],
+            cache=cache,
+        )
+        return modified[0], recoded[0]
+
+    return Protein, process
+
+
+def make_annotator(options, load_table):
+    """Returns a function giving extra fields of a result line (primers of the
+    result, codon metrics of the sequence before it was made into a part), or
+    None if the request asks for none"""
+    primer_tm = options.get("primer_tm")
+    table = load_table(options["target_organism"]) if options.get("metrics") else None
+    if not primer_tm and table is None:
+        return None
+
+    def annotate(result, recoded):
+        fields = {}
+        if primer_tm and isinstance(result, Nucleotide):
+            forward, reverse = result.design_primers(target_tm=primer_tm)
+            fields["primers"] = {
+                "forward": forward._asdict() if forward else None,
+                "reverse": reverse._asdict() if reverse else None,
+            }
+        if table is not None and isinstance(recoded, Nucleotide):
+            fields["metrics"] = (
+                recoded.codon_metrics(table) if recoded.basic_cds else None
+            )
+        return fields
+
+    return annotate
+
+
+def stream_results(records, sequence_type, process, annotate=None):
+    """Yields one NDJSON line per record while later records are still waiting.
+    Records that can not be processed produce a line with an "error" and
+    malformed FASTA input ends the stream with one. annotate (see
+    make_annotator) adds fields to every line."""
+    records = iter(records)
+    while True:
+        try:
+            sequence_id, sequence = next(records)
+        except StopIteration:
+            return
+        except FastaError as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+
+        try:
+            result, recoded = process(sequence_type(sequence_id, sequence))
+            line = {
+                "input_id": sequence_id,
+                "id": result.sequence_id,
+                "sequence": result.sequence,
+            }
+            if annotate is not None:
+                line.update(annotate(result, recoded))
+        except ValueError as e:
+            line = {"input_id": sequence_id, "error": str(e)}
+        yield json.dumps(line) + "\n"
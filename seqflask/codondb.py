@@ -0,0 +1,144 @@
+# cSpell: disable
+import os
+import mmap
+import numpy
+
+MAGIC = b"CODONDB1"
+
+# magic, number of organisms, sizes of the taxid and species string tables
+_HEADER = numpy.dtype(
+    [("magic", "S8"), ("count", "<u8"), ("keys", "<u8"), ("names", "<u8")]
+)
+
+
+def _layout(count, keys, names):
+    """Returns {section: (offset, dtype, length)} of a database file. Every
+    section starts at a multiple of 8 bytes."""
+    sections = [
+        ("counts", "<u4", count * 64),
+        ("sources", "u1", count),
+        ("order", "<u4", count),
+        ("key_offsets", "<u8", count + 1),
+        ("name_offsets", "<u8", count + 1),
+        ("keys", "u1", keys),
+        ("names", "u1", names),
+    ]
+    layout, offset = {}, _HEADER.itemsize
+    for name, dtype, length in sections:
+        layout[name] = (offset, numpy.dtype(dtype), length)
+        offset += -(-numpy.dtype(dtype).itemsize * length // 8) * 8
+    return layout
+
+
+def read_spsum(path):
+    """Yields (taxid, species, counts) of every organism in a spsum file"""
+    with open(path, "rb") as handle:
+        for header in handle:
+            counts = handle.readline()
+            if header.strip() and counts:
+                taxid, species = header.decode().strip().split(":")[:2]
+                yield taxid, species, [int(x) for x in counts.split()]
+
+
+def build_database(path, main_path, custom_path):
+    """Writes the organisms of the main and custom spsum files into a database.
+
+    Rows are sorted by (taxid, source) so a taxid is found by binary search;
+    "order" keeps the rows in file order (main table first) for listings. The
+    file is written next to path and renamed, so readers never see a partial
+    database. Returns the number of organisms."""
+    entries, seen = [], set()
+    for source, spsum in enumerate((main_path, custom_path)):
+        if not os.path.exists(spsum):
+            continue
+        for taxid, species, counts in read_spsum(spsum):
+            if (taxid, source) not in seen:
+                seen.add((taxid, source))
+                entries.append((taxid.encode(), source, species.encode(), counts))
+
+    rows = sorted(range(len(entries)), key=lambda i: entries[i][:2])
+    keys = [entries[i][0] for i in rows]
+    names = [entries[i][2] for i in rows]
+    layout = _layout(len(rows), sum(map(len, keys)), sum(map(len, names)))
+
+    arrays = {
+        "counts": numpy.array([entries[i][3] for i in rows], dtype="<u4").reshape(-1),
+        "sources": numpy.array([entries[i][1] for i in rows], dtype="u1"),
+        "order": numpy.argsort(rows).astype("<u4"),
+        "key_offsets": numpy.cumsum([0] + [len(key) for key in keys], dtype="<u8"),
+        "name_offsets": numpy.cumsum([0] + [len(name) for name in names], dtype="<u8"),
+        "keys": numpy.frombuffer(b"".join(keys), dtype="u1"),
+        "names": numpy.frombuffer(b"".join(names), dtype="u1"),
+    }
+    header = numpy.array(
+        [(MAGIC, len(rows), len(arrays["keys"]), len(arrays["names"]))], _HEADER
+    )
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as handle:
+        handle.write(header.tobytes())
+        for name, (offset, dtype, length) in layout.items():
+            handle.seek(offset)
+            handle.write(arrays[name].astype(dtype).tobytes())
+        handle.truncate(max(handle.tell(), _HEADER.itemsize))
+    os.replace(temporary, path)
+
+    return len(rows)
+
+
+class CodonDatabase:
+    """Read-only view of a binary codon usage database.
+
+    The file is mapped into memory and every section is a numpy view of the
+    mapping, so processes that open the same file share its pages and an
+    organism costs nothing until its counts are read."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as handle:
+            self.mtime = os.fstat(handle.fileno()).st_mtime_ns
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = numpy.frombuffer(self._map, _HEADER, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"Not a codon usage database: {path}")
+        self.count = int(header["count"])
+
+        layout = _layout(self.count, int(header["keys"]), int(header["names"]))
+        for name, (offset, dtype, length) in layout.items():
+            setattr(
+                self,
+                name,
+                numpy.frombuffer(self._map, dtype=dtype, count=length, offset=offset),
+            )
+        self.counts = self.counts.reshape(self.count, 64)
+
+    def __len__(self):
+        return self.count
+
+    def key(self, row):
+        return bytes(self.keys[self.key_offsets[row] : self.key_offsets[row + 1]])
+
+    def species(self, row):
+        name = self.names[self.name_offsets[row] : self.name_offsets[row + 1]]
+        return bytes(name).decode()
+
+    def find(self, taxonomy_id, source):
+        """Returns the row of an organism from one source (0 main, 1 custom) or
+        None. Binary search over the sorted taxids."""
+        key, low, high = (str(taxonomy_id).encode(), source), 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if (self.key(middle), int(self.sources[middle])) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.key(low) == key[0] and self.sources[low] == source:
+            return low
+        return None
+
+    def rows(self, source):
+        """Yields rows of one source in file order"""
+        for row in self.order:
+            if self.sources[row] == source:
+                yield int(row)
@@ -0,0 +1,118 @@
+# cSpell: disable
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from seqflask.utils import iter_fasta, open_fasta
+from seqflask.encoding import CODON_CODES, encode_sequence
+
+CodonCounts = namedtuple("CodonCounts", ["counts", "genes", "partial", "unknown"])
+
+
+def count_records(records):
+    """Counts codons of (name, sequence) records with one 65-bin histogram.
+    Records that are not a whole number of codons are not used and codons with
+    other letters than ACGT(U) are dropped. Returns CodonCounts with the names
+    of the partial records."""
+    used, partial = [], []
+    for name, sequence in records:
+        if len(sequence) % 3:
+            partial.append(name)
+        else:
+            used.append(sequence)
+
+    # Histogram of base-5 triplet codes, folded into codon indices
+    bases = encode_sequence("".join(used)).reshape(-1, 3)
+    triplets = numpy.bincount(
+        bases[:, 0] * 25 + bases[:, 1] * 5 + bases[:, 2], minlength=125
+    )
+    histogram = numpy.bincount(CODON_CODES, weights=triplets, minlength=65)
+    histogram = histogram.astype(numpy.int64)
+    return CodonCounts(histogram[:64], len(used), partial, int(histogram[64]))
+
+
+def merge_counts(parts):
+    """Sums partial CodonCounts"""
+    counts, genes, partial, unknown = numpy.zeros(64, dtype=numpy.int64), 0, [], 0
+    for part in parts:
+        counts += part.counts
+        genes += part.genes
+        partial.extend(part.partial)
+        unknown += part.unknown
+    return CodonCounts(counts, genes, partial, unknown)
+
+
+def count_block(block):
+    """Parses and counts a block of whole FASTA records (in a worker process)"""
+    return count_records(iter_fasta(block))
+
+
+def iter_blocks(handle, block_size):
+    """Splits a (decompressed) FASTA into bytes blocks of about block_size that
+    only contain whole records, so they can be parsed independently"""
+    if isinstance(handle, (str, os.PathLike)) and os.path.isfile(handle):
+        with open(handle, "rb") as stream:
+            yield from iter_blocks(stream, block_size)
+        return
+
+    stream, rest = open_fasta(handle, binary=True), b""
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b"\n>")
+        if cut < 0:
+            rest = data
+        else:
+            yield data[: cut + 1]
+            rest = data[cut + 1 :]
+    if rest:
+        yield rest
+
+
+def count_fasta(handles, workers=None, block_size=1 << 22):
+    """Counts codons of CDS in one or more (optionally gzip or bz2 compressed)
+    FASTA files, paths or strings.
+
+    The input is split into blocks of whole records that are parsed and counted
+    by a process pool. Only a few blocks per worker are in flight at a time, so
+    memory use does not grow with the input. With workers=1 everything runs in
+    this process."""
+    workers = workers or os.cpu_count() or 1
+    blocks = (block for handle in handles for block in iter_blocks(handle, block_size))
+    if workers == 1:
+        return merge_counts(count_block(block) for block in blocks)
+
+    parts, pending = [], deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for block in blocks:
+            pending.append(executor.submit(count_block, block))
+            if len(pending) >= 2 * workers:
+                parts.append(pending.popleft().result())
+        parts.extend(future.result() for future in pending)
+
+    return merge_counts(parts)
+
+
+def format_spsum(taxonomy_id, species, counts, genes):
+    """Returns the two spsum lines (header and codon counts) of an organism"""
+    if ":" in str(taxonomy_id) or ":" in species:
+        raise ValueError("Taxonomy ID and species name can not contain ':'")
+
+    return (
+        f"{taxonomy_id}:{species}: {genes}\n"
+        + " ".join(str(int(count)) for count in counts)
+        + "\n"
+    )
+
+
+def append_spsum(path, taxonomy_id, species, counts, genes):
+    """Appends an organism to a spsum file (e.g. the custom table of the app)"""
+    entry = format_spsum(taxonomy_id, species, counts, genes).encode()
+    with open(path, "a+b") as handle:
+        if handle.tell():
+            handle.seek(-1, os.SEEK_END)
+            if handle.read(1) != b"\n":
+                entry = b"\n" + entry
+        handle.write(entry)
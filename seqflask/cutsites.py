@@ -0,0 +1,101 @@
+# cSpell: disable
+from collections import deque
+from functools import lru_cache
+from seqflask.encoding import NUCLEOTIDES, encode_sequence
+
+
+def reverse_complement(sequence):
+    """Returns reverse complement of a DNA string"""
+    return sequence.translate(str.maketrans("ACGT", "TGCA"))[::-1]
+
+
+class CutsiteScanner:
+    """Aho-Corasick automaton finding every recognition site on both strands.
+
+    The automaton is a dense DFA over base codes (ACGT -> 0..3, anything else
+    -> 4, which always returns to the root), so a sequence is scanned in a
+    single pass regardless of the number of sites."""
+
+    def __init__(self, sites):
+        sites = [site.upper() for site in sites]
+        for site in sites:
+            if not site or site.strip(NUCLEOTIDES):
+                raise ValueError(f"Invalid recognition site: {site!r}")
+
+        self.sites = sorted(set(sites) | {reverse_complement(s) for s in sites})
+        self.longest = max((len(site) for site in self.sites), default=0)
+
+        # Trie
+        transitions, outputs = [[None] * 5], [()]
+        for site in self.sites:
+            state = 0
+            for base in site:
+                code = NUCLEOTIDES.index(base)
+                if transitions[state][code] is None:
+                    transitions.append([None] * 5)
+                    outputs.append(())
+                    transitions[state][code] = len(transitions) - 1
+                state = transitions[state][code]
+            outputs[state] += (site,)
+
+        # Failure links folded into the transitions (breadth first)
+        queue = deque()
+        for code in range(5):
+            child = transitions[0][code]
+            if child is None:
+                transitions[0][code] = 0
+            else:
+                queue.append((child, 0))
+        while queue:
+            state, fail = queue.popleft()
+            outputs[state] += outputs[fail]
+            for code in range(4):
+                child = transitions[state][code]
+                if child is None:
+                    transitions[state][code] = transitions[fail][code]
+                else:
+                    queue.append((child, transitions[fail][code]))
+            transitions[state][4] = 0
+
+        self.transitions = transitions
+        self.outputs = outputs
+
+    def __len__(self):
+        return len(self.sites)
+
+    def step(self, state, code):
+        """Returns the automaton state after reading one base code"""
+        return self.transitions[state][code]
+
+    def scan(self, sequence, start=0, end=None):
+        """Returns a list of (position, site) for every site in sequence[start:end],
+        ordered by position"""
+        transitions, outputs = self.transitions, self.outputs
+        hits, state = [], 0
+        for i, code in enumerate(encode_sequence(sequence[start:end]).tobytes()):
+            state = transitions[state][code]
+            if outputs[state]:
+                for site in outputs[state]:
+                    hits.append((start + i - len(site) + 1, site))
+
+        return sorted(hits)
+
+    def search(self, sequence):
+        """Returns True if sequence contains any of the sites"""
+        transitions, outputs = self.transitions, self.outputs
+        state = 0
+        for code in encode_sequence(sequence).tobytes():
+            state = transitions[state][code]
+            if outputs[state]:
+                return True
+        return False
+
+
+@lru_cache(maxsize=32)
+def _compile(sites):
+    return CutsiteScanner(sites)
+
+
+def get_scanner(sites):
+    """Returns a compiled (cached) scanner for a list of recognition sites"""
+    return _compile(tuple(sites))
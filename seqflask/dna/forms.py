@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField
 from wtforms import StringField, SubmitField, BooleanField, SelectField, RadioField
 from wtforms.widgets import TextArea
 from wtforms.validators import DataRequired, Length, Optional
@@ -10,8 +11,9 @@ class nucleotideSequenceForm(FlaskForm):
     dna_sequence = StringField(
         "DNA Sequence(s)",
         widget=TextArea(),
-        validators=[DataRequired(), Length(min=10, max=10000)],
+        validators=[Optional(), Length(min=10, max=10000)],
     )
+    dna_file = FileField("Or upload a FASTA file (plain, .gz or .bz2)")
     target_organism = SelectField(
         "Select your target organism",
         choices=GlobalVariables.ORGANISM_CHOICES,
@@ -35,5 +37,10 @@ class nucleotideSequenceForm(FlaskForm):
         validators=[Optional()],
     )
     maximize = BooleanField("Maximize", validators=[Optional()])
+    penalized = BooleanField(
+        "Avoid GC extremes, homopolymers and cutsites", validators=[Optional()]
+    )
     plot = BooleanField("Draw plots", validators=[Optional()])
+    metrics = BooleanField("Codon metrics", validators=[Optional()])
+    background = BooleanField("Run in background", validators=[Optional()])
     submit = SubmitField("Submit")
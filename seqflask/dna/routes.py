@@ -1,9 +1,12 @@
 import os
-from flask import Blueprint, render_template, url_for, flash, redirect
+import json
+from flask import Blueprint, render_template, url_for, flash, redirect, abort
 from seqflask.modules import Nucleotide
-from seqflask.utils import fasta_parser, GlobalVariables, clean_old_plots
+from seqflask.utils import iter_fasta, GlobalVariables
+from seqflask.jobs import job_queue
 from seqflask.dna.forms import nucleotideSequenceForm
-from seqflask.dna.utils import dna_operation
+from seqflask.dna.utils import dna_operation, dna_job_options
+from seqflask.instrumentation import span
 
 
 dna = Blueprint("dna", __name__)
@@ -12,17 +15,21 @@ dna = Blueprint("dna", __name__)
 @dna.route("/dna", methods=["GET", "POST"])
 def dna_page():
     form = nucleotideSequenceForm()
-    clean_old_plots()
     if form.validate_on_submit():
         if form.operation.data == "harmonize" and form.source_organism.data == "0000":
             flash(f"Please select source organism!", "warning")
             return render_template("dna.html", title="DNA", form=form)
 
         try:
-            list_of_sequences = [
-                Nucleotide(rec[0], rec[1])
-                for rec in fasta_parser(form.dna_sequence.data)
-            ]
+            with span("fasta_parser"):
+                list_of_sequences = [
+                    Nucleotide(rec[0], rec[1])
+                    for rec in iter_fasta(
+                        form.dna_file.data.stream
+                        if form.dna_file.data
+                        else form.dna_sequence.data or ""
+                    )
+                ]
         except ValueError as e:
             flash(e, "danger")
             return render_template("dna.html", title="DNA", form=form)
@@ -33,6 +40,11 @@ def dna_page():
         if not list_of_sequences or len(list_of_sequences[0]) == 0:
             flash(f"Nothing to do here...", "warning")
             return redirect(url_for("dna.dna_page"))
+        elif form.background.data:
+            if form.plot.data:
+                flash("Plots are not drawn for background jobs.", "info")
+            job_id = job_queue().submit(dna_job_options(list_of_sequences, form))
+            return redirect(url_for("dna.dna_job", job_id=job_id))
         else:
             if form.plot.data:
                 for seq in list_of_sequences:
@@ -42,15 +54,43 @@ def dna_page():
                             "One sequence or more is not a CDS. No plotting for you mister!",
                             "warning",
                         )
-            modified = dna_operation(list_of_sequences=list_of_sequences, form=form)
+            modified, plots, primers, metrics = dna_operation(
+                list_of_sequences=list_of_sequences, form=form
+            )
 
         if modified:
-            return render_template(
-                "dna.html",
-                title="DNA",
-                form=form,
-                modified=modified,
-                draw_plot=form.plot.data,
-            )
+            with span("render_template"):
+                return render_template(
+                    "dna.html",
+                    title="DNA",
+                    form=form,
+                    modified=modified,
+                    plots=plots,
+                    primers=primers,
+                    metrics=metrics,
+                    draw_plot=form.plot.data,
+                )
 
     return render_template("dna.html", title="DNA", form=form)
+
+
+@dna.route("/dna/jobs/<job_id>")
+def dna_job(job_id):
+    job = job_queue().status(job_id)
+    if job is None:
+        abort(404)
+
+    modified = []
+    if job["status"] == "done":
+        for line in job_queue().result(job_id).splitlines():
+            result = json.loads(line)
+            if "error" in result:
+                flash(f"{result['input_id']}: {result['error']}", "danger")
+            else:
+                modified.append(
+                    {"sequence_id": result["id"], "sequence": result["sequence"]}
+                )
+    elif job["status"] == "failed":
+        flash(f"Job failed: {job['error']}", "danger")
+
+    return render_template("job.html", title="DNA", job=job, modified=modified)
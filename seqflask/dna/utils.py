@@ -1,4 +1,11 @@
-from seqflask.utils import load_codon_table
+from flask import current_app
+from seqflask.tables import CodonTable, load_codon_table
+from seqflask.modules import harmonize_many, translate_many
+from seqflask.primers import design_primers_many
+from seqflask.metrics import codon_metrics, metrics_rows
+from seqflask.instrumentation import count, label_request, span
+from seqflask.memo import result_cache
+from seqflask.optimizer import DEFAULT_BEAM_WIDTH
 
 DNA_OPERATIONS = [
     ("translate", "Translate"),
@@ -8,101 +15,190 @@ DNA_OPERATIONS = [
 ]
 
 
-def dna_operation(list_of_sequences, form):
-    CODON_TABLE = load_codon_table(taxonomy_id=form.target_organism.data)
+def deterministic(operation, maximize=False, golden_gate=None):
+    """Whether a DNA operation always gives the same result. Codons are sampled
+    unless maximized and cutsites are removed with sampled codons, which also
+    happens to every GoldenGate part that is not made with "part"."""
+    if operation in ("translate", "part"):
+        return True
+    if golden_gate not in (None, "0000"):
+        return False
+    return operation == "harmonize" or (operation == "optimize" and maximize)
 
-    for target in form.target_organism.choices:
-        if target[0] == form.target_organism.data:
-            target_organism_name = target[1]
 
-    if form.operation.data == "translate":
-        modified = [
-            single.translate(table=CODON_TABLE, check=True)
+def run_dna_operation(
+    list_of_sequences,
+    operation,
+    table,
+    source=None,
+    maximize=False,
+    golden_gate=None,
+    beam_width=0,
+    cache=None,
+):
+    """Runs a DNA operation on a list of sequences. Returns the modified sequences
+    and the same sequences before they were made into GoldenGate parts.
+    Operation "part" only adds the GoldenGate prefix/suffix; beam_width selects
+    the optimizer used by "optimize" (0 samples every codon on its own).
+    Results of deterministic runs are taken from and added to cache, a
+    seqflask.memo.ResultCache, if given."""
+    count("sequences_processed_total", len(list_of_sequences), operation=operation)
+    compute = lambda batch: _run_dna_operation(
+        batch, operation, table, source, maximize, golden_gate, beam_width
+    )
+    if cache is None or not deterministic(operation, maximize, golden_gate):
+        return compute(list_of_sequences)
+
+    options = (
+        "dna",
+        operation,
+        CodonTable.coerce(table).digest,
+        CodonTable.coerce(source).digest if operation == "harmonize" else None,
+        golden_gate or "0000",
+        (bool(maximize), beam_width) if operation == "optimize" else None,
+    )
+    return cache.run(list_of_sequences, options, compute)
+
+
+def _run_dna_operation(
+    list_of_sequences, operation, table, source, maximize, golden_gate, beam_width
+):
+    make_part = golden_gate not in (None, "0000")
+
+    if operation == "translate":
+        modified = translate_many(list_of_sequences, table=table, check=True)
+        return modified, modified
+
+    if operation == "optimize":
+        recoded = [
+            single.optimize_codon_usage(
+                table=table, maximum=maximize, beam_width=beam_width
+            )
             for single in list_of_sequences
         ]
-        if form.plot.data:
-            for n, rec in enumerate(list_of_sequences):
-                rec.plot_codon_usage(
-                    window=16,
-                    table=CODON_TABLE,
-                    target_organism=target_organism_name,
-                    n=n,
-                )
+    elif operation == "harmonize":
+        recoded = harmonize_many(list_of_sequences, source=source, table=table)
+    elif operation in ("remove", "part"):
+        recoded = list(list_of_sequences)
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
 
-    if form.operation.data == "optimize":
+    if operation == "remove" or (make_part and operation != "part"):
+        recoded = [single.remove_cutsites(table=table) for single in recoded]
+
+    modified = recoded
+    if make_part:
         modified = [
-            single.optimize_codon_usage(table=CODON_TABLE, maximum=form.maximize.data)
-            for single in list_of_sequences
+            single.make_part(part_type=golden_gate, table=table) for single in recoded
         ]
-        if form.golden_gate.data != "0000":
-            modified = [
-                single.remove_cutsites(table=CODON_TABLE) for single in modified
-            ]
-        if form.plot.data:
-            for n, rec in enumerate(zip(list_of_sequences, modified)):
-                rec[1].plot_codon_usage(
-                    window=16,
-                    other=rec[0],
-                    table=CODON_TABLE,
-                    table_other=CODON_TABLE,
-                    target_organism=target_organism_name,
-                    n=n,
-                )
-        if form.golden_gate.data != "0000":
-            modified = [
-                single.make_part(part_type=form.golden_gate.data, table=CODON_TABLE)
-                for single in modified
-            ]
 
+    return modified, recoded
+
+
+def form_beam_width(form):
+    """Beam width of "optimize": OPTIMIZER_BEAM_WIDTH, or the default width if
+    the form asks for the penalized search and the config sets none"""
+    beam_width = current_app.config["OPTIMIZER_BEAM_WIDTH"]
+    if form.penalized.data and not beam_width:
+        beam_width = DEFAULT_BEAM_WIDTH
+    return beam_width
+
+
+def dna_operation(list_of_sequences, form):
+    label_request(
+        operation=form.operation.data,
+        organism=form.target_organism.data,
+        bases=sum(len(single) for single in list_of_sequences),
+    )
+    with span("load_codon_table"):
+        CODON_TABLE = load_codon_table(taxonomy_id=form.target_organism.data)
+    SOURCE_TABLE = None
+
+    for target in form.target_organism.choices:
+        if target[0] == form.target_organism.data:
+            target_organism_name = target[1]
+
+    source_organism_name = None
     if form.operation.data == "harmonize":
         for target in form.source_organism.choices:
             if target[0] == form.source_organism.data:
                 source_organism_name = target[1]
 
-        SOURCE_TABLE = load_codon_table(taxonomy_id=form.source_organism.data)
+        with span("load_codon_table"):
+            SOURCE_TABLE = load_codon_table(taxonomy_id=form.source_organism.data)
 
-        modified = [
-            single.harmonize(table=CODON_TABLE, source=SOURCE_TABLE, mode=0)
-            for single in list_of_sequences
-        ]
+    with span("operation"):
+        modified, recoded = run_dna_operation(
+            list_of_sequences,
+            form.operation.data,
+            table=CODON_TABLE,
+            source=SOURCE_TABLE,
+            maximize=form.maximize.data,
+            golden_gate=form.golden_gate.data,
+            beam_width=form_beam_width(form),
+            cache=result_cache(),
+        )
 
-        if form.golden_gate.data != "0000":
-            modified = [
-                single.remove_cutsites(table=CODON_TABLE) for single in modified
-            ]
-        if form.plot.data:
-            for n, rec in enumerate(zip(list_of_sequences, modified)):
-                rec[1].plot_codon_usage(
-                    window=16,
-                    other=rec[0],
-                    other_id=source_organism_name,
-                    table=CODON_TABLE,
-                    table_other=SOURCE_TABLE,
-                    target_organism=target_organism_name,
-                    n=n,
+    plots = []
+    if form.plot.data:
+        with span("plot_codon_usage"):
+            if form.operation.data in ("translate", "remove"):
+                plotted = (
+                    list_of_sequences if form.operation.data == "translate" else recoded
                 )
-        if form.golden_gate.data != "0000":
-            modified = [
-                single.make_part(part_type=form.golden_gate.data, table=CODON_TABLE)
-                for single in modified
-            ]
+                plots = [
+                    rec.plot_codon_usage(
+                        window=16,
+                        table=CODON_TABLE,
+                        target_organism=target_organism_name,
+                    )
+                    for rec in plotted
+                ]
+            else:
+                plots = [
+                    rec[1].plot_codon_usage(
+                        window=16,
+                        other=rec[0],
+                        other_id=source_organism_name,
+                        table=CODON_TABLE,
+                        table_other=SOURCE_TABLE or CODON_TABLE,
+                        target_organism=target_organism_name,
+                    )
+                    for rec in zip(list_of_sequences, recoded)
+                ]
+
+    primers = []
+    if form.operation.data != "translate" and form.golden_gate.data != "0000":
+        with span("design_primers"):
+            primers = design_primers_many(
+                [single.sequence for single in modified],
+                target_tm=current_app.config["PRIMER_TARGET_TM"],
+            )
+
+    metrics = []
+    if form.metrics.data:
+        measured = list_of_sequences if form.operation.data == "translate" else recoded
+        with span("codon_metrics"):
+            rows = metrics_rows(codon_metrics(measured, table=CODON_TABLE))
+        metrics = [row if rec.basic_cds else None for rec, row in zip(measured, rows)]
+
+    return modified, plots, primers, metrics
 
-    if form.operation.data == "remove":
-        modified = [
-            single.remove_cutsites(table=CODON_TABLE) for single in list_of_sequences
-        ]
-        if form.plot.data:
-            for n, rec in enumerate(list_of_sequences):
-                rec.plot_codon_usage(
-                    window=16,
-                    table=CODON_TABLE,
-                    target_organism=target_organism_name,
-                    n=n,
-                )
-        if form.golden_gate.data != "0000":
-            modified = [
-                single.make_part(part_type=form.golden_gate.data, table=CODON_TABLE)
-                for single in modified
-            ]
 
-    return modified
+def dna_job_options(list_of_sequences, form):
+    """Describes a form submission as options of a background job"""
+    return {
+        "kind": "dna",
+        "operation": form.operation.data,
+        "records": [
+            (single.sequence_id, single.sequence) for single in list_of_sequences
+        ],
+        "target_organism": form.target_organism.data,
+        "source_organism": (
+            form.source_organism.data if form.operation.data == "harmonize" else None
+        ),
+        "maximize": form.maximize.data,
+        "golden_gate": form.golden_gate.data,
+        "beam_width": form_beam_width(form),
+        "metrics": form.metrics.data,
+    }
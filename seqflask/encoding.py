@@ -0,0 +1,50 @@
+# cSpell: disable
+import numpy
+from seqflask.utils import GlobalVariables
+
+NUCLEOTIDES = "ACGT"
+
+# byte -> 0..3 for A, C, G, T (U is read as T) and 4 for anything else
+BASE_CODES = numpy.full(256, 4, dtype=numpy.uint8)
+for code, base in enumerate(NUCLEOTIDES):
+    BASE_CODES[ord(base)] = BASE_CODES[ord(base.lower())] = code
+BASE_CODES[ord("U")] = BASE_CODES[ord("u")] = 3
+
+# base-5 triplet code -> index in GlobalVariables.CODONS, 64 for unknown codons
+CODON_CODES = numpy.full(125, 64, dtype=numpy.uint8)
+for index, codon in enumerate(GlobalVariables.CODONS):
+    a, b, c = (NUCLEOTIDES.index(base) for base in codon)
+    CODON_CODES[a * 25 + b * 5 + c] = index
+
+
+def as_bytes(sequence):
+    """Returns sequence as a uint8 array without copying bytes input"""
+    if isinstance(sequence, str):
+        sequence = sequence.encode()
+    return numpy.frombuffer(sequence, dtype=numpy.uint8)
+
+
+def encode_sequence(sequence):
+    """Encodes a nucleotide sequence into uint8 base codes (ACGT -> 0..3, other -> 4)"""
+    return BASE_CODES[as_bytes(sequence)]
+
+
+def encode_codons(sequence):
+    """Encodes a nucleotide sequence into uint8 codon indices in spsum order.
+    Codons with unknown bases and a trailing partial codon are encoded as 64."""
+    bases = encode_sequence(sequence).astype(numpy.intp)
+    complete = len(bases) - len(bases) % 3
+    triplets = bases[:complete].reshape(-1, 3)
+    codons = CODON_CODES[triplets[:, 0] * 25 + triplets[:, 1] * 5 + triplets[:, 2]]
+    if complete < len(bases):
+        codons = numpy.append(codons, numpy.uint8(64))
+    return codons
+
+
+def encode_codons_many(sequences):
+    """Encodes a batch of sequences into one codon index array.
+    Returns (codons, offsets) where record i spans codons[offsets[i]:offsets[i+1]]."""
+    padded = [sequence + "N" * (-len(sequence) % 3) for sequence in sequences]
+    offsets = numpy.zeros(len(padded) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum([len(sequence) // 3 for sequence in padded])
+    return encode_codons("".join(padded)), offsets
@@ -1,12 +1,25 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, BooleanField, SelectField, IntegerField
+from wtforms import (
+    StringField,
+    SubmitField,
+    BooleanField,
+    SelectField,
+    IntegerField,
+    FloatField,
+)
 from wtforms.validators import DataRequired, NumberRange, Optional
 
 
 class generatorForm(FlaskForm):
     sequence_name = StringField("Sequence name", validators=[Optional()])
     sequence_length = IntegerField(
-        "Sequence length", validators=[DataRequired(), NumberRange(min=1, max=99999)]
+        "Sequence length",
+        validators=[DataRequired(), NumberRange(min=1, max=1000000)],
+    )
+    number_of_sequences = IntegerField(
+        "Number of sequences",
+        default=1,
+        validators=[DataRequired(), NumberRange(min=1, max=100)],
     )
     max_gc_stretch = IntegerField(
         "Maximum GC stretch",
@@ -18,6 +31,16 @@ class generatorForm(FlaskForm):
         default=10,
         validators=[DataRequired(), NumberRange(min=1)],
     )
+    min_gc_ratio = FloatField(
+        "Minimum GC ratio",
+        default=0.3,
+        validators=[Optional(), NumberRange(min=0, max=1)],
+    )
+    max_gc_ratio = FloatField(
+        "Maximum GC ratio",
+        default=1.0,
+        validators=[Optional(), NumberRange(min=0, max=1)],
+    )
     golden_gate = BooleanField(
         "Remove GoldenGate restriction enzymes", validators=[Optional()]
     )
@@ -1,6 +1,6 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, current_app, flash
 from seqflask.generator.forms import generatorForm
-from seqflask.generator.utils import random_dna
+from seqflask.generator.utils import random_dna_many
 from seqflask.modules import Nucleotide
 
 generator = Blueprint("generator", __name__)
@@ -10,16 +10,33 @@ generator = Blueprint("generator", __name__)
 def generator_page():
     form = generatorForm()
     if form.validate_on_submit():
-        modified = [
-            Nucleotide(
-                form.sequence_name.data,
-                random_dna(
-                    form.sequence_length.data,
-                    homopolymer=form.homopolymer.data,
-                    gc_stretch=form.max_gc_stretch.data,
-                    restriction=form.golden_gate.data,
+        number = form.number_of_sequences.data
+        if number * form.sequence_length.data > current_app.config.get(
+            "GENERATOR_MAX_BASES", 2000000
+        ):
+            flash("That is too much DNA for one order!", "warning")
+            return render_template("generator.html", title="Generator", form=form)
+
+        try:
+            sequences = random_dna_many(
+                number,
+                form.sequence_length.data,
+                homopolymer=form.homopolymer.data,
+                gc_stretch=form.max_gc_stretch.data,
+                min_gc_ratio=form.min_gc_ratio.data or 0.0,
+                max_gc_ratio=(
+                    1.0 if form.max_gc_ratio.data is None else form.max_gc_ratio.data
                 ),
+                restriction=form.golden_gate.data,
             )
+        except ValueError as e:
+            flash(e, "danger")
+            return render_template("generator.html", title="Generator", form=form)
+
+        name = form.sequence_name.data
+        modified = [
+            Nucleotide(name if number == 1 else f"{name}_{n + 1}", sequence)
+            for n, sequence in enumerate(sequences)
         ]
         return render_template(
             "generator.html", title="GEN-results", modified=modified, form=form
@@ -1,86 +1,155 @@
-from random import choice
+import os
+import math
+import numpy
 from seqflask.utils import GlobalVariables
+from seqflask.cutsites import get_scanner
+
+BASES = b"ACGT"
+IS_GC = (0, 1, 1, 0)
+
+_random = numpy.random.default_rng()
+
+
+def _reseed():
+    global _random
+    _random = numpy.random.default_rng()
+
+
+# Forked workers (e.g. of a preloaded gunicorn app) would draw the same bases
+os.register_at_fork(after_in_child=_reseed)
+
+
+def _max_gc(remaining, gc_run, gc_stretch):
+    """Most G/C bases that still fit into remaining positions after a G/C run"""
+    room = gc_stretch - gc_run
+    if remaining <= room:
+        return remaining
+    blocks, rest = divmod(remaining - room, gc_stretch + 1)
+    return room + blocks * gc_stretch + max(rest - 1, 0)
 
 
 def random_dna(
-    length, homopolymer=10, gc_stretch=20, max_gc_ratio=0.3, restriction=False
+    length,
+    homopolymer=10,
+    gc_stretch=20,
+    min_gc_ratio=0.3,
+    max_gc_ratio=1.0,
+    restriction=False,
+    rng=None,
 ):
+    """Generates a random DNA sequence in one forward pass.
+
+    Every base is drawn from the bases a constraint state machine still allows:
+    the current homopolymer and G/C run, the state of the restriction site
+    automaton and whether the GC ratio bounds of the whole sequence can still
+    be met. A position without any allowed base backtracks to the previous one,
+    so all constraints hold over the entire sequence, joins included. Random
+    numbers are drawn from NumPy in batches."""
+    if homopolymer < 1 or gc_stretch < 1:
+        raise ValueError("Homopolymer and GC stretch lengths must be positive")
+    if not 0 <= min_gc_ratio <= max_gc_ratio <= 1:
+        raise ValueError("GC ratio bounds must satisfy 0 <= min <= max <= 1")
+
+    rng = rng or _random
+    scanner = get_scanner(GlobalVariables.RESTRICTION_ENZYMES if restriction else ())
+    transitions, outputs = scanner.transitions, scanner.outputs
+    gc_low = math.ceil(min_gc_ratio * length - 1e-9)
+    gc_high = math.floor(max_gc_ratio * length + 1e-9)
+    target = min(max(0.5, min_gc_ratio), max_gc_ratio)
+    dense = gc_stretch / (gc_stretch + 1)
 
-    dna = ("A", "C", "G", "T")
-
-    def generate(length, chars=dna):
-        return "".join(choice(chars) for _ in range(length))
-
-    def check_restriction(
-        sequence, restriction_set=GlobalVariables.RESTRICTION_ENZYMES
-    ):
-        for restriction_site in restriction_set:
-            if restriction_site in sequence:
-                return True
-        return False
-
-    def check_homopolymer(sequence, upper_bound, chars=dna):
-        for char in chars:
-            if char * (upper_bound + 1) in sequence:
-                return True
-        return False
-
-    def check_gc_cont(sequence, lower_bound):
-        if not lower_bound < sum(map(sequence.count, ("G", "C"))) / len(sequence):
-            return True
-        return False
-
-    def check_gc_stretch(sequence, upper_bound):
-        longest, gc = 0, 0
-        for char in sequence:
-            if char in "GC":
-                gc += 1
-            elif longest < gc:
-                longest = gc
-            if char in "AT":
-                gc = 0
-        if longest >= upper_bound:
-            return True
-        return False
-
-    def run_tests(
-        sequence_string,
-        homopolymer=homopolymer,
-        gc_stretch=gc_stretch,
-        restriction=restriction,
-        max_gc_ratio=max_gc_ratio,
-    ):
-        a = check_homopolymer(sequence_string, upper_bound=homopolymer)
-        b = check_gc_stretch(sequence_string, upper_bound=gc_stretch)
-        c = False
-        d = False
-        if restriction:
-            c = check_restriction(sequence_string)
-        if max_gc_ratio:
-            d = check_gc_cont(sequence_string, lower_bound=max_gc_ratio)
-        if a or b or c or d:
-            return True
-        return False
-
-    ## TODO: binary tree search for sequence assembly
-    candidates, confirmed = [], []
-    treshold = min(gc_stretch, homopolymer) * 5
-
-    if length < treshold:
-        candidates.append(generate(length))
-    else:
-        while length > treshold:
-            candidates.append(generate(treshold))
-            length -= treshold
-        candidates.append(generate(length))
-
-    while candidates:
-        if run_tests(candidates[0]):
-            l = len(candidates[0])
-            candidates.append(generate(l))
-            candidates.pop(0)
+    # States (last base, its run, G/C run, automaton state) are numbered as they
+    # are reached; the allowed G/C and A/T moves of a state are found once
+    keys, numbers, gc_moves, at_moves = [], {}, [], []
+
+    def number(key):
+        if key not in numbers:
+            numbers[key] = len(keys)
+            keys.append(key)
+            gc_moves.append(None)
+            at_moves.append(None)
+        return numbers[key]
+
+    def expand(state):
+        last, run, gc_run, node = keys[state]
+        gc_moves[state], at_moves[state] = [], []
+        for code in range(4):
+            new_gc_run = gc_run + 1 if IS_GC[code] else 0
+            next_node = transitions[node][code]
+            if code == last and run >= homopolymer:
+                continue
+            if new_gc_run > gc_stretch or outputs[next_node]:
+                continue
+            move = (
+                code,
+                number((code, run + 1 if code == last else 1, new_gc_run, next_node)),
+            )
+            (gc_moves if IS_GC[code] else at_moves)[state].append(move)
+
+    sequence = bytearray(length)
+    history = [None] * length
+    excluded = [0] * length
+    state, gc = number((-1, 0, 0, 0)), 0
+    batch = min(length, 1 << 16)
+    draws, drawn = [], batch
+    i, backtracks, limit = 0, 0, 10 * length + 1000
+
+    while i < length:
+        if gc_moves[state] is None:
+            expand(state)
+        gcs, ats = gc_moves[state], at_moves[state]
+        remaining = length - i - 1
+
+        # G/C count bounds are only checked move by move close to them
+        if gc + 1 > gc_high:
+            gcs = []
+        if gc + remaining * dense - gc_stretch < gc_low:
+            gcs = [
+                move
+                for move in gcs
+                if gc + 1 + _max_gc(remaining, keys[move[1]][2], gc_stretch) >= gc_low
+            ]
+            if gc + _max_gc(remaining, 0, gc_stretch) < gc_low:
+                ats = []
+        if excluded[i]:
+            gcs = [move for move in gcs if not excluded[i] >> move[0] & 1]
+            ats = [move for move in ats if not excluded[i] >> move[0] & 1]
+
+        if not gcs and not ats:
+            backtracks += 1
+            if i == 0 or backtracks > limit:
+                raise ValueError("Constraints can not be satisfied")
+            excluded[i] = 0
+            i -= 1
+            excluded[i] |= 1 << sequence[i]
+            state, gc = history[i]
+            continue
+
+        if drawn == batch:
+            draws, drawn = rng.random(batch).tolist(), 0
+        # Drift of the G/C count is corrected towards the target ratio
+        p_gc = target + (target * i - gc) * 0.03125
+        if p_gc < 0.02:
+            p_gc = 0.02
+        elif p_gc > 0.98:
+            p_gc = 0.98
+        gc_weight = p_gc * len(gcs)
+        point = draws[drawn] * (gc_weight + (1 - p_gc) * len(ats))
+        drawn += 1
+        if point < gc_weight:
+            moves, pick = gcs, int(point / p_gc)
         else:
-            confirmed.append(candidates[0])
-            candidates.pop(0)
+            moves, pick = ats, int((point - gc_weight) / (1 - p_gc))
+        code, next_state = moves[pick] if pick < len(moves) else moves[-1]
+
+        history[i] = (state, gc)
+        sequence[i] = code
+        state, gc = next_state, gc + IS_GC[code]
+        i += 1
+
+    return sequence.translate(bytes(BASES) + bytes(252)).decode()
+
 
-    return "".join(confirmed)
+def random_dna_many(number, length, **constraints):
+    """Generates a number of random DNA sequences with the same constraints"""
+    return [random_dna(length, **constraints) for _ in range(number)]
@@ -0,0 +1,68 @@
+# cSpell: disable
+from functools import lru_cache
+import numpy
+from seqflask.tables import CodonTable
+from seqflask.encoding import encode_codons, encode_codons_many
+
+HARMONIZATION_MODES = (0, 1)
+
+
+def _closest(source_fraction, fractions):
+    """Index of the target codon whose fraction is closest to source_fraction.
+    Ties go to the lower fraction and then to the first codon with it."""
+    best, chosen = 1, 0
+    for fraction in sorted(fractions):
+        if abs(fraction - source_fraction) < best:
+            best, chosen = abs(fraction - source_fraction), fraction
+    return fractions.index(chosen) if chosen in fractions else None
+
+
+@lru_cache(maxsize=256)
+def _compile(source, table, mode):
+    mapping = numpy.arange(65, dtype=numpy.uint8)
+    for start, end in zip(table.starts, table.ends):
+        group = table.order[start:end]
+        fractions = [float(table.fraction[codon]) for codon in group]
+        source_fractions = source.fraction[group]
+
+        if mode == 0:
+            for codon, source_fraction in zip(group, source_fractions):
+                chosen = _closest(float(source_fraction), fractions)
+                if chosen is not None:
+                    mapping[codon] = group[chosen]
+        else:
+            # Same rank among synonymous codons; ties keep the table order
+            ranks = numpy.argsort(source_fractions, kind="stable")
+            targets = group[numpy.argsort(fractions, kind="stable")]
+            mapping[group[ranks]] = targets
+
+    mapping.setflags(write=False)
+    return mapping
+
+
+def harmonization_map(source, table, mode=0):
+    """Returns a 65-entry array mapping codon indices of the source organism to
+    codon indices of the target organism (64 stays unknown).
+
+    mode 0 picks the synonymous codon with the closest fraction, mode 1 the
+    synonymous codon of the same rank. The map only depends on the two tables
+    and the mode, so it is compiled once per organism pair."""
+    if mode not in HARMONIZATION_MODES:
+        raise ValueError(f"Unknown harmonization mode: {mode}")
+    return _compile(CodonTable.coerce(source), CodonTable.coerce(table), mode)
+
+
+def harmonize_codons(sequence, source, table, mode=0):
+    """Harmonizes a CDS string in one vectorized pass"""
+    table = CodonTable.coerce(table)
+    mapping = harmonization_map(source, table, mode)
+    return table.codon_bytes[mapping[encode_codons(sequence)]].tobytes().decode()
+
+
+def harmonize_codons_many(sequences, source, table, mode=0):
+    """Harmonizes a batch of CDS strings with a single gather"""
+    table = CodonTable.coerce(table)
+    mapping = harmonization_map(source, table, mode)
+    codons, offsets = encode_codons_many(sequences)
+    harmonized = table.codon_bytes[mapping[codons]].tobytes().decode()
+    return [harmonized[3 * start : 3 * end] for start, end in zip(offsets, offsets[1:])]
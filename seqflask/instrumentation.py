@@ -0,0 +1,395 @@
+# cSpell: disable
+import os
+import json
+import time
+import uuid
+import atexit
+import bisect
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of exited processes are not folded
+    fcntl = None
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+)
+
+PREFIX = "seqflask_"
+
+# Upper bounds (seconds) of the duration histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds (bases) of the sequence length label of a request
+LENGTHS = ((1_000, "1k"), (10_000, "10k"), (100_000, "100k"), (1_000_000, "1M"))
+
+COUNTERS = {
+    "sequences_processed_total": "Sequences run through an operation",
+    "cutsites_removed_total": "Restriction sites removed by recoding",
+    "plots_rendered_total": "Plot images rendered with matplotlib",
+    "memo_hits_total": "Records whose result came from the result cache",
+    "memo_misses_total": "Records computed and added to the result cache",
+}
+
+HISTOGRAMS = {
+    "request_duration_seconds": "Time spent handling a request",
+    "stage_duration_seconds": "Time spent in one stage of a request",
+}
+
+# Most seconds a process keeps new numbers before writing them to the directory
+FLUSH_INTERVAL = 1.0
+
+# Sum of the numbers of exited processes, in the metrics directory
+EXITED = "exited.json"
+
+exporter = Blueprint("exporter", __name__)
+
+
+class Instrumentation:
+    """Thread-safe counters and histograms of one process.
+
+    Observations only bump a bucket under a lock; cumulative buckets and the
+    text format are put together when /metrics is scraped. With a directory,
+    every process (e.g. gunicorn worker) also writes its numbers to a file of
+    its own there, at most every FLUSH_INTERVAL seconds and on exit, and a
+    scrape adds up the files of all processes, so totals never depend on the
+    worker that answers. Files of exited processes are folded into one file of
+    their sum, so the directory does not grow as workers are replaced."""
+
+    def __init__(self, buckets=BUCKETS, directory=None):
+        self.buckets = tuple(buckets)
+        self.directory = directory
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._flushed = 0.0
+
+        if self.directory:
+            atexit.register(self.flush, force=True)
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(
+            directory=app.config.get("METRICS_DIRECTORY")
+            or os.path.join(app.instance_path, "metrics")
+        )
+
+    def _process(self):
+        """Starts over in a process forked after numbers were taken, which are
+        the parent's; must be called with the lock held"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._path = None
+            self._counters = {}
+            self._histograms = {}
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._process()
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._process()
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        """Copies of ({(name, labels): value}, {(name, labels): (buckets, sum)})"""
+        with self._lock:
+            self._process()
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(buckets), total)
+                for key, (buckets, total) in self._histograms.items()
+            }
+        return counters, histograms
+
+    def flush(self, force=False):
+        """Writes the numbers of this process to its file in directory, unless
+        that was done less than FLUSH_INTERVAL seconds ago"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed < FLUSH_INTERVAL:
+            return
+        self._flushed = now
+
+        counters, histograms = self.snapshot()
+        if not counters and not histograms:
+            return
+        with self._lock:
+            if self._path is None:
+                # The pid alone could be reused by a later process
+                name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+                self._path = os.path.join(self.directory, name)
+            path = self._path
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(path, counters, histograms)
+
+    def _write(self, path, counters, histograms):
+        data = {
+            "buckets": self.buckets,
+            "counters": [
+                [name, labels, value] for (name, labels), value in counters.items()
+            ],
+            "histograms": [
+                [name, labels, buckets, total]
+                for (name, labels), (buckets, total) in histograms.items()
+            ],
+        }
+        temporary = f"{path}.{threading.get_ident()}"
+        with open(temporary, "w") as handle:
+            json.dump(data, handle)
+        os.replace(temporary, path)
+
+    def _read(self, path, counters, histograms):
+        """Adds the numbers of a metrics file to counters and histograms"""
+        try:
+            with open(path) as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return
+        if tuple(data["buckets"]) != self.buckets:
+            return
+        for metric, labels, value in data["counters"]:
+            key = (metric, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, buckets, total in data["histograms"]:
+            key = (metric, tuple(tuple(label) for label in labels))
+            entry = histograms.get(key, ([0] * len(buckets), 0.0))
+            histograms[key] = (
+                [a + b for a, b in zip(entry[0], buckets)],
+                entry[1] + total,
+            )
+
+    def _fold(self):
+        """Adds the files of exited processes to EXITED and deletes them, and
+        leftovers of writes they did not finish"""
+        exited = [
+            name
+            for name in os.listdir(self.directory)
+            if name != EXITED and not _alive(name.split("-", 1)[0])
+        ]
+        if not exited:
+            return
+
+        counters, histograms = {}, {}
+        total = os.path.join(self.directory, EXITED)
+        self._read(total, counters, histograms)
+        for name in exited:
+            if name.endswith(".json"):
+                self._read(os.path.join(self.directory, name), counters, histograms)
+        self._write(total, counters, histograms)
+        for name in exited:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def merged(self):
+        """Snapshot of the numbers of all processes writing to directory (only
+        of this one without a directory)"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush(force=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+        counters, histograms = {}, {}
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            # Scrapes in other workers must not fold the same files twice
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._fold()
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith(".json"):
+                    path = os.path.join(self.directory, name)
+                    self._read(path, counters, histograms)
+        return counters, histograms
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4) of all metrics"""
+        counters, histograms = self.merged()
+        lines = []
+
+        for name, description in COUNTERS.items():
+            lines.append(f"# HELP {PREFIX}{name} {description}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (key, labels), value in sorted(counters.items()):
+                if key == name:
+                    lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for name, description in HISTOGRAMS.items():
+            lines.append(f"# HELP {PREFIX}{name} {description}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (key, labels), (buckets, total) in sorted(histograms.items()):
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, hits in zip(bounds, buckets):
+                    cumulative += hits
+                    bucket_labels = _labels(labels + (("le", bound),))
+                    lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _alive(pid):
+    """Whether the process of a metrics file name's pid part is running"""
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def length_bucket(bases):
+    """Sequence length label: the smallest of LENGTHS holding bases, or +Inf"""
+    for bound, label in LENGTHS:
+        if bases <= bound:
+            return label
+    return "+Inf"
+
+
+def instrumentation(app=None):
+    """Returns metrics registry of the (current) app"""
+    app = app or current_app
+    if "instrumentation" not in app.extensions:
+        app.extensions["instrumentation"] = Instrumentation.from_app(app)
+    return app.extensions["instrumentation"]
+
+
+def clear_directory(directory):
+    """Deletes the metrics files of earlier runs, before workers are started"""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            os.remove(os.path.join(directory, name))
+
+
+def _enabled():
+    return has_app_context() and current_app.config.get("METRICS_ENABLED", True)
+
+
+def count(name, amount=1, **labels):
+    """Adds to a counter of the current app; does nothing outside of one (e.g.
+    in background job workers) or with metrics disabled"""
+    if amount and _enabled():
+        instrumentation().count(name, amount, **labels)
+
+
+def label_request(operation=None, organism=None, bases=None):
+    """Sets labels of the timings of the current request"""
+    if not has_request_context() or "request_labels" not in g:
+        return
+    if operation is not None:
+        g.request_labels["operation"] = operation
+    if organism is not None:
+        g.request_labels["organism"] = organism
+    if bases is not None:
+        g.request_labels["length"] = length_bucket(bases)
+
+
+@contextmanager
+def span(stage):
+    """Times the block as a stage of the current request; spans are observed
+    when the response is ready and sent in its Server-Timing header"""
+    if not has_request_context() or "spans" not in g:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.spans.append((stage, time.perf_counter() - start))
+
+
+def start_request():
+    if current_app.config.get("METRICS_ENABLED", True):
+        g.request_start = time.perf_counter()
+        g.request_labels = {}
+        g.spans = []
+
+
+def finish_request(response):
+    """Observes request and stage durations. Streamed responses are timed
+    until their body starts."""
+    if "request_start" not in g:
+        return response
+    duration = time.perf_counter() - g.request_start
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    labels = {"operation": "", "organism": "", "length": ""}
+    labels.update(g.request_labels)
+
+    registry = instrumentation()
+    registry.observe(
+        "request_duration_seconds",
+        duration,
+        route=route,
+        method=request.method,
+        status=response.status_code,
+        **labels,
+    )
+    for stage, seconds in g.spans:
+        registry.observe(
+            "stage_duration_seconds", seconds, route=route, stage=stage, **labels
+        )
+
+    if g.spans:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.spans
+        )
+    registry.flush()
+    return response
+
+
+def init_app(app):
+    """Times every request of app; the numbers are served at /metrics"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.register_blueprint(exporter)
+
+
+@exporter.route("/metrics")
+def metrics_page():
+    return Response(
+        instrumentation().exposition(), mimetype="text/plain; version=0.0.4"
+    )
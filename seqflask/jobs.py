@@ -0,0 +1,362 @@
+# cSpell: disable
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from seqflask.tables import CodonTableRegistry, codon_tables
+from seqflask.api.utils import make_annotator, make_processor, stream_results
+
+FINISHED = ("done", "failed")
+
+# Most seconds between heartbeats of a running job (a third of the timeout if
+# that is shorter)
+HEARTBEAT = 5.0
+
+# Times a job is claimed before one that stopped responding counts as failed
+MAX_ATTEMPTS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    options TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)"""
+
+# Columns added after the first release, for databases created before them
+_COLUMNS = {
+    "heartbeat": "heartbeat REAL",
+    "attempts": "attempts INTEGER NOT NULL DEFAULT 0",
+}
+
+jobs_cli = AppGroup("jobs", help="Background job queue")
+
+# Codon table registries of worker processes, reused between jobs
+_registries = {}
+
+
+def connect(database):
+    """Opens the job database (autocommit, WAL so readers never block writers)"""
+    connection = sqlite3.connect(database, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(_SCHEMA)
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+    for name, definition in _COLUMNS.items():
+        if name not in columns:
+            try:
+                connection.execute(f"ALTER TABLE jobs ADD COLUMN {definition}")
+            except sqlite3.OperationalError:
+                # Added by another process in the meantime
+                pass
+    return connection
+
+
+def recover(connection, timeout):
+    """Running jobs without a heartbeat for timeout seconds lost their worker
+    process: they are queued again, or failed after MAX_ATTEMPTS claims.
+    Returns the number of jobs queued again."""
+    now = time.time()
+    stale = "status = 'running' AND COALESCE(heartbeat, started) < ?"
+    connection.execute(
+        "UPDATE jobs SET status = 'failed', error = ?, finished = ? "
+        f"WHERE {stale} AND attempts >= ?",
+        ("Worker stopped responding", now, now - timeout, MAX_ATTEMPTS),
+    )
+    return connection.execute(
+        "UPDATE jobs SET status = 'queued', processed = 0, started = NULL, "
+        f"heartbeat = NULL WHERE {stale}",
+        (now - timeout,),
+    ).rowcount
+
+
+def claim(connection, job_id=None, limit=None, timeout=None):
+    """Atomically marks a queued job (the oldest one if job_id is None) as running,
+    unless limit jobs are running already. Stale jobs are recovered first if a
+    timeout is given. Returns (id, attempt) of the claimed job or None."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if timeout:
+            recover(connection, timeout)
+        running = connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'running'"
+        ).fetchone()[0]
+        if limit is not None and running >= limit:
+            row = None
+        elif job_id is None:
+            row = connection.execute(
+                "SELECT id, attempts FROM jobs WHERE status = 'queued' "
+                "ORDER BY created LIMIT 1"
+            ).fetchone()
+        else:
+            row = connection.execute(
+                "SELECT id, attempts FROM jobs WHERE status = 'queued' AND id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is not None:
+            now = time.time()
+            connection.execute(
+                "UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (now, now, row["id"]),
+            )
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+    return (row["id"], row["attempts"] + 1) if row is not None else None
+
+
+def _beat(database, job_id, attempt, stop, interval):
+    """Updates the heartbeat of a claimed job every interval seconds until stop
+    is set, also while a single long record is processed"""
+    with closing(connect(database)) as connection:
+        while not stop.wait(interval):
+            connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND attempts = ? "
+                "AND status = 'running'",
+                (time.time(), job_id, attempt),
+            )
+
+
+def run_job(
+    database, table_paths, job_id=None, progress_every=100, limit=None, timeout=None
+):
+    """Claims a job and processes all of its records. Runs in worker processes,
+    so codon tables are loaded straight from the spsum files without Flask.
+    Returns the id of the job that was run or None if there was nothing to do."""
+    with closing(connect(database)) as connection:
+        claimed = claim(connection, job_id, limit=limit, timeout=timeout)
+        if claimed is None:
+            return None
+        job_id, attempt = claimed
+        # Updates only apply while this claim of the job is the current one
+        current = "id = ? AND attempts = ? AND status = 'running'"
+
+        interval = min(HEARTBEAT, timeout / 3) if timeout else HEARTBEAT
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_beat, args=(database, job_id, attempt, stop, interval), daemon=True
+        )
+        heartbeat.start()
+        try:
+            row = connection.execute(
+                "SELECT options FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            options = json.loads(row["options"])
+
+            registry = _registries.get(table_paths)
+            if registry is None:
+                main_path, custom_path, codon_database = table_paths
+                registry = _registries[table_paths] = CodonTableRegistry(
+                    main_path, custom_path, database=codon_database
+                )
+            load_table = lambda taxid: registry.get(taxid)[0]
+            sequence_type, process = make_processor(options, load_table)
+
+            lines = []
+            for line in stream_results(
+                options["records"],
+                sequence_type,
+                process,
+                make_annotator(options, load_table),
+            ):
+                lines.append(line)
+                if len(lines) % progress_every == 0:
+                    connection.execute(
+                        f"UPDATE jobs SET processed = ?, heartbeat = ? WHERE {current}",
+                        (len(lines), time.time(), job_id, attempt),
+                    )
+            connection.execute(
+                "UPDATE jobs SET status = 'done', processed = ?, result = ?, "
+                f"finished = ? WHERE {current}",
+                (len(lines), "".join(lines), time.time(), job_id, attempt),
+            )
+        except Exception as e:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? "
+                f"WHERE {current}",
+                (f"{type(e).__name__}: {e}", time.time(), job_id, attempt),
+            )
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    return job_id
+
+
+def drain(database, table_paths, limit=None, timeout=None):
+    """Runs queued jobs until none is left or limit jobs are running. Returns
+    the number of jobs run."""
+    count = 0
+    while run_job(database, table_paths, limit=limit, timeout=timeout) is not None:
+        count += 1
+    return count
+
+
+class JobQueue:
+    """Queue of API batch jobs kept in a SQLite database.
+
+    Any process on the machine can submit, claim and read jobs, so no broker is
+    needed: jobs are executed by local process pools of the web processes and/or
+    by `flask jobs work`. Pools claim queued jobs in turn, with at most workers
+    of them running at once over all web processes. Running jobs send a
+    heartbeat; those silent for timeout seconds are queued again. Only the newest
+    finished jobs (retention) are kept."""
+
+    def __init__(self, database, table_paths, workers=2, retention=100, timeout=60):
+        self.database = database
+        self.table_paths = tuple(table_paths)
+        self.workers = workers
+        self.retention = retention
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+        with closing(connect(self.database)):
+            pass
+
+    @classmethod
+    def from_app(cls, app):
+        database = app.config.get("JOB_DATABASE") or os.path.join(
+            app.instance_path, "jobs.sqlite3"
+        )
+        os.makedirs(os.path.dirname(database), exist_ok=True)
+        registry = codon_tables(app)
+        return cls(
+            database,
+            (registry.paths[False], registry.paths[True], registry.database),
+            workers=app.config.get("JOB_WORKERS", 2),
+            retention=app.config.get("JOB_RETENTION", 100),
+            timeout=app.config.get("JOB_TIMEOUT", 60),
+        )
+
+    def executor(self):
+        """Returns the local process pool (None if jobs are left to external
+        workers). A new pool recovers stale jobs and starts on queued ones."""
+        if self.workers <= 0:
+            return None
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                with closing(connect(self.database)) as connection:
+                    recover(connection, self.timeout)
+                for _ in range(self.workers):
+                    self._drain(self._executor)
+            return self._executor
+
+    def _drain(self, executor):
+        return executor.submit(
+            drain, self.database, self.table_paths, self.workers, self.timeout
+        )
+
+    def kick(self):
+        """Has the local pool run queued jobs, if there is one. A pool broken by
+        a dead process is replaced."""
+        executor = self.executor()
+        if executor is None:
+            return
+        try:
+            self._drain(executor)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            self.executor()
+
+    def submit(self, options):
+        """Stores a job and hands it to the local pool. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        with closing(connect(self.database)) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, options, total, created) "
+                "VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(options), len(options["records"]), time.time()),
+            )
+            self.prune(connection)
+
+        self.kick()
+
+        return job_id
+
+    def status(self, job_id):
+        """Returns a dict describing a job or None if it does not exist. Stale
+        jobs found on the way are queued again and handed to the local pool."""
+        with closing(connect(self.database)) as connection:
+            recovered = recover(connection, self.timeout)
+            row = connection.execute(
+                "SELECT id, status, total, processed, error, created, started, "
+                "finished FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        # Pool processes are forked, so never while a connection is open
+        if recovered:
+            self.kick()
+
+        return dict(row) if row is not None else None
+
+    def result(self, job_id):
+        """Returns NDJSON results of a finished job or None"""
+        with closing(connect(self.database)) as connection:
+            row = connection.execute(
+                "SELECT result FROM jobs WHERE id = ? AND status = 'done'", (job_id,)
+            ).fetchone()
+
+        return row["result"] if row is not None else None
+
+    def prune(self, connection):
+        """Deletes finished jobs except for the newest ones"""
+        connection.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND id NOT IN "
+            "(SELECT id FROM jobs WHERE status IN ('done', 'failed') "
+            "ORDER BY finished DESC LIMIT ?)",
+            (self.retention,),
+        )
+
+    def work(self, poll=1.0, once=False):
+        """Runs queued jobs in this process until interrupted (or the queue is
+        empty if once). Returns the number of jobs run."""
+        count = 0
+        while True:
+            if run_job(self.database, self.table_paths, timeout=self.timeout):
+                count += 1
+            elif once:
+                return count
+            else:
+                time.sleep(poll)
+
+
+def job_queue(app=None):
+    """Returns the job queue of the application"""
+    app = app or current_app
+    if "jobs" not in app.extensions:
+        app.extensions["jobs"] = JobQueue.from_app(app)
+    return app.extensions["jobs"]
+
+
+@jobs_cli.command("work")
+@click.option("--once", is_flag=True, help="Exit when the queue is empty.")
+@click.option("--poll", default=1.0, help="Seconds between polls of the queue.")
+def work_command(once, poll):
+    """Run queued jobs in this process"""
+    count = job_queue().work(poll=poll, once=once)
+    click.echo(f"Ran {count} jobs")
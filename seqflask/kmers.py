@@ -0,0 +1,94 @@
+# cSpell: disable
+import numpy
+from seqflask.encoding import encode_sequence
+
+# k-mers are 2-bit codes in an int64, so 31 bases at most
+MAX_K = 31
+
+# Above this many possible k-mers counts come from numpy.unique, not bincount
+BINCOUNT_LIMIT = 1 << 22
+
+BASES = numpy.frombuffer(b"ACGT", dtype=numpy.uint8)
+
+
+def _encode(sequences):
+    """Base codes of one sequence or of a batch joined by unknown bases, so no
+    k-mer spans two records"""
+    if isinstance(sequences, (str, bytes)):
+        return encode_sequence(sequences)
+    return encode_sequence("N".join(str(sequence) for sequence in sequences))
+
+
+def rolling_codes(bases, lengths, canonical=False):
+    """Yields (k, codes) for every k in lengths, where codes[i] is the 2-bit code
+    of the k-mer starting at base i. K-mers with unknown bases are left out.
+
+    Codes of k + 1 are rolled from the codes of k with one shift and one or, so
+    all lengths together cost about as much as the longest one. With canonical
+    every k-mer is replaced by the smaller of its code and the code of its
+    reverse complement."""
+    lengths = sorted(set(lengths))
+    if not lengths:
+        return
+    if lengths[0] < 1 or lengths[-1] > MAX_K:
+        raise ValueError(f"K-mer lengths must be between 1 and {MAX_K}")
+
+    known = bases < 4
+    values = numpy.where(known, bases, 0).astype(numpy.int64)
+    complement = 3 - values
+    unknown = numpy.concatenate(([0], numpy.cumsum(~known)))
+
+    codes, reverse = values.copy(), complement.copy()
+    for k in range(1, lengths[-1] + 1):
+        if k > 1:
+            codes = (codes[:-1] << 2) | values[k - 1 :]
+            reverse = reverse[:-1] | (complement[k - 1 :] << (2 * k - 2))
+        if k in lengths:
+            valid = unknown[k:] == unknown[:-k]
+            found = numpy.minimum(codes, reverse) if canonical else codes
+            yield k, found[valid]
+
+
+def kmer_counts(sequences, lengths=(8,), canonical=False):
+    """Counts k-mers of one sequence or a batch of sequences.
+    Returns {k: (codes, counts)} of the k-mers that occur, codes ascending."""
+    result = {}
+    for k, codes in rolling_codes(_encode(sequences), lengths, canonical):
+        if 4**k <= BINCOUNT_LIMIT:
+            counts = numpy.bincount(codes, minlength=4**k)
+            present = numpy.flatnonzero(counts)
+            result[k] = (present, counts[present])
+        else:
+            result[k] = numpy.unique(codes, return_counts=True)
+    return result
+
+
+def decode_kmers(codes, k):
+    """Returns the bases of 2-bit k-mer codes as a list of strings"""
+    shifts = numpy.arange(2 * k - 2, -1, -2, dtype=numpy.int64)
+    letters = BASES[(numpy.asarray(codes, dtype=numpy.int64)[:, None] >> shifts) & 3]
+    return letters.view(f"S{k}").ravel().astype(str).tolist()
+
+
+def top_kmers(counts, k, number=None, threshold=0):
+    """Returns [(kmer, count)] of the number most frequent k-mers occurring more
+    than threshold times, most frequent first. Only the selected k-mers are
+    sorted (numpy.argpartition picks them)."""
+    codes, occurrences = counts
+    above = numpy.flatnonzero(occurrences > threshold)
+    if number is not None and number < len(above):
+        if number <= 0:
+            return []
+        picked = numpy.argpartition(-occurrences[above], number - 1)[:number]
+        above = above[picked]
+    above = above[numpy.lexsort((codes[above], -occurrences[above]))]
+    return list(zip(decode_kmers(codes[above], k), occurrences[above].tolist()))
+
+
+def repeated_kmers(sequences, lengths=(8,), number=None, threshold=1, canonical=False):
+    """Returns {k: [(kmer, count)]} of k-mers occurring more than threshold
+    times in one sequence or a batch of sequences, most frequent first"""
+    return {
+        k: top_kmers(counts, k, number=number, threshold=threshold)
+        for k, counts in kmer_counts(sequences, lengths, canonical).items()
+    }
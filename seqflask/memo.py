@@ -0,0 +1,249 @@
+# cSpell: disable
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from functools import lru_cache
+from flask import current_app
+from seqflask import __version__
+from seqflask.modules import Nucleotide, Protein
+from seqflask.instrumentation import count
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)"""
+
+# Stands in for the sequence id while a record is computed; result ids are
+# stored with it, so one entry serves records of any id
+PLACEHOLDER = "\x00"
+
+# Parts of a sequence id that change what an operation does (remove_cutsites
+# adds |REC only once, unchecked translation takes FORCED records)
+MARKS = ("|REC", "FORCED")
+
+SEQUENCE_TYPES = {"Nucleotide": Nucleotide, "Protein": Protein}
+
+
+@lru_cache(maxsize=1)
+def code_version():
+    """Package version and a digest of the source of every seqflask module, so
+    any code change invalidates stored results"""
+    package = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for directory, folders, files in os.walk(package):
+        folders.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, package).encode() + b"\0")
+                with open(path, "rb") as handle:
+                    digest.update(handle.read())
+    return f"{__version__}+{digest.hexdigest()[:16]}"
+
+
+def _marks(sequence_id):
+    return "".join(mark for mark in MARKS if mark in sequence_id)
+
+
+def result_key(sequence, marks, options):
+    """(sequence digest, id marks, *options, code version)"""
+    digest = hashlib.sha256(sequence.encode()).hexdigest()
+    return (digest, marks) + tuple(options) + (code_version(),)
+
+
+def _text(key):
+    return json.dumps(key)
+
+
+def _entry(result, stand_in):
+    """(sequence type, id with the placeholder for the input id, sequence)"""
+    template = result.sequence_id.replace(stand_in, PLACEHOLDER, 1)
+    return (type(result).__name__, template, result.sequence)
+
+
+def _restore(entry, sequence_id):
+    sequence_type, template, sequence = entry
+    return SEQUENCE_TYPES[sequence_type](
+        template.replace(PLACEHOLDER, sequence_id, 1), sequence
+    )
+
+
+class ResultCache:
+    """Bounded LRU of results of deterministic operations.
+
+    Entries are keyed by result_key, i.e. by the content of a record and not by
+    its id, and hold the modified record and the record before it was made into
+    a GoldenGate part. With a database, entries are also written to SQLite and
+    survive restarts; it is shared by all processes and pruned to maxsize.
+    Results of another code_version are dropped when the database is opened."""
+
+    def __init__(self, maxsize=1024, database=None):
+        self.maxsize = maxsize
+        self.database = database
+        self.stats = {"hits": 0, "misses": 0, "duplicates": 0, "loads": 0}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+
+        if self.database:
+            with closing(self.connect()) as connection:
+                self._check_version(connection)
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(
+            app.config.get("MEMO_CACHE_SIZE", 1024),
+            database=app.config.get("MEMO_DATABASE"),
+        )
+
+    def connect(self):
+        connection = sqlite3.connect(self.database, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _check_version(self, connection):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM meta WHERE name = 'version'"
+            ).fetchone()
+            if row is None or row[0] != code_version():
+                connection.execute("DELETE FROM results")
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                    (code_version(),),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """Returns a stored (modified, recoded) entry or None"""
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        if not self.database:
+            return None
+
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT value FROM results WHERE key = ?", (_text(key),)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE results SET used = ? WHERE key = ?", (time.time(), _text(key))
+            )
+        entry = tuple(tuple(part) for part in json.loads(row[0]))
+        self._remember(key, entry)
+        with self._lock:
+            self.stats["loads"] += 1
+        return entry
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if not self.database:
+            return
+
+        with closing(self.connect()) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (_text(key), json.dumps(entry), time.time()),
+            )
+            self._stores += 1
+            if self._stores % 100 == 0:
+                connection.execute(
+                    "DELETE FROM results WHERE key NOT IN "
+                    "(SELECT key FROM results ORDER BY used DESC LIMIT ?)",
+                    (self.maxsize,),
+                )
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._results[key] = entry
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def run(self, sequences, options, compute):
+        """Returns compute(sequences), i.e. lists of modified and recoded
+        records, taking known results from the cache. Records of the same
+        content are computed once per batch; compute only sees the others,
+        with a placeholder id."""
+        entries = [None] * len(sequences)
+        pending = OrderedDict()
+        hits = duplicates = 0
+        for n, single in enumerate(sequences):
+            marks = _marks(single.sequence_id)
+            key = result_key(single.sequence, marks, options)
+            if key in pending:
+                pending[key][1].append(n)
+                duplicates += 1
+                continue
+            entries[n] = self.get(key)
+            if entries[n] is not None:
+                hits += 1
+                continue
+            stand_in = type(single)(PLACEHOLDER + marks, single.sequence)
+            pending[key] = (stand_in, [n])
+
+        if pending:
+            stand_ins = [stand_in for stand_in, _ in pending.values()]
+            modified, recoded = compute(stand_ins)
+            for (key, (stand_in, indexes)), first, second in zip(
+                pending.items(), modified, recoded
+            ):
+                stand_in = stand_in.sequence_id
+                entry = (_entry(first, stand_in), _entry(second, stand_in))
+                self.put(key, entry)
+                for n in indexes:
+                    entries[n] = entry
+
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(pending)
+            self.stats["duplicates"] += duplicates
+        count("memo_hits_total", hits)
+        count("memo_misses_total", len(pending))
+
+        return (
+            [_restore(e[0], s.sequence_id) for e, s in zip(entries, sequences)],
+            [_restore(e[1], s.sequence_id) for e, s in zip(entries, sequences)],
+        )
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+        if self.database:
+            with closing(self.connect()) as connection:
+                connection.execute("DELETE FROM results")
+
+
+def result_cache(app=None):
+    """Returns the result cache of the (current) app, or None if MEMO_CACHE_SIZE
+    is 0"""
+    app = app or current_app
+    if "memo" not in app.extensions:
+        app.extensions["memo"] = (
+            ResultCache.from_app(app)
+            if app.config.get("MEMO_CACHE_SIZE", 1024)
+            else None
+        )
+    return app.extensions["memo"]
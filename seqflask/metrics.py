@@ -0,0 +1,179 @@
+# cSpell: disable
+import math
+from functools import lru_cache
+import numpy
+from seqflask.utils import GlobalVariables
+from seqflask.tables import AMINO_ACIDS, CodonTable
+from seqflask.encoding import encode_codons_many, encode_sequence
+from seqflask.profiles import profile_series
+
+METRICS = (
+    "cai",
+    "fop",
+    "gc",
+    "gc3",
+    "enc",
+    "minmax_mean",
+    "minmax_min",
+    "minmax_max",
+)
+
+# Relative adaptiveness given to codons the reference never uses
+MINIMUM_WEIGHT = 0.01
+
+# Effective number of codons: amino acids per degeneracy class (Wright 1990)
+ENC_CLASSES = {2: 9, 3: 1, 4: 5, 6: 3}
+
+_GC = numpy.array(
+    [codon[2] in "GC" for codon in GlobalVariables.CODONS] + [False], dtype=float
+)
+
+
+@lru_cache(maxsize=64)
+def _weights(table):
+    """Per codon (65 entries): log relative adaptiveness, optimal codon flag and
+    whether the codon counts for CAI and Fop (not Met, Trp, stops or unknown)"""
+    fraction = numpy.nan_to_num(table.fraction)
+    best = numpy.zeros(65)
+    for start, end in zip(table.starts, table.ends):
+        group = table.order[start:end]
+        best[group] = fraction[group].max()
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        relative = numpy.where(best[:64] > 0, fraction / best[:64], 0.0)
+
+    residues = numpy.array(list(GlobalVariables.STANDARD_GENETIC_CODE))
+    counted = numpy.append(~numpy.isin(residues, ("M", "W", "*")), False)
+    log_weights = numpy.append(numpy.log(numpy.maximum(relative, MINIMUM_WEIGHT)), 0)
+    optimal = numpy.zeros(65, dtype=bool)
+    optimal[table.best] = True
+    return log_weights * counted, optimal & counted, counted
+
+
+@lru_cache(maxsize=1)
+def _families():
+    """(64 x amino acids) one-hot matrix of the standard genetic code and the
+    degeneracy of every amino acid"""
+    residues = [AMINO_ACIDS.index(a) for a in GlobalVariables.STANDARD_GENETIC_CODE]
+    onehot = numpy.zeros((64, len(AMINO_ACIDS)))
+    onehot[numpy.arange(64), residues] = 1
+    degeneracy = onehot.sum(axis=0)
+    degeneracy[AMINO_ACIDS.index("*")] = 0
+    return onehot, degeneracy
+
+
+def _counts(codons, offsets):
+    rows = numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+    counts = numpy.bincount(rows * 65 + codons, minlength=(len(offsets) - 1) * 65)
+    return counts.reshape(-1, 65)
+
+
+def codon_counts(sequences):
+    """Returns a (sequences x 65) matrix of codon counts in spsum order; the last
+    column counts unknown and partial codons"""
+    return _counts(*encode_codons_many([str(sequence) for sequence in sequences]))
+
+
+def _gc_content(sequences):
+    """G/C share of the known bases of every sequence"""
+    lengths = numpy.array([len(sequence) for sequence in sequences], dtype=numpy.int64)
+    # A trailing unknown base keeps every start (also of empty sequences) valid
+    codes = encode_sequence("".join(sequences) + "N")
+    starts = numpy.cumsum(lengths) - lengths
+    known = numpy.add.reduceat(codes < 4, starts, dtype=numpy.int64)
+    strong = numpy.add.reduceat((codes == 1) | (codes == 2), starts, dtype=numpy.int64)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return numpy.where(lengths > 0, strong / known, numpy.nan)
+
+
+def _minmax_summary(codons, offsets, table, window):
+    """(mean, min, max) of the finite %MinMax windows inside every sequence"""
+    summary = numpy.full((len(offsets) - 1, 3), numpy.nan)
+    values = profile_series(codons, table, (window,))[window]
+    rows = numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+    rows = rows[: len(values)]
+    inside = numpy.arange(len(values)) + window <= offsets[rows + 1]
+    kept = inside & numpy.isfinite(values)
+    rows, values = rows[kept], values[kept]
+    if not len(values):
+        return summary
+
+    present, starts, sizes = numpy.unique(rows, return_index=True, return_counts=True)
+    summary[present, 0] = numpy.add.reduceat(values, starts) / sizes
+    summary[present, 1] = numpy.minimum.reduceat(values, starts)
+    summary[present, 2] = numpy.maximum.reduceat(values, starts)
+    return summary
+
+
+def effective_number_of_codons(counts):
+    """ENC (Wright 1990) of every row of a codon count matrix. Amino acids seen
+    less than twice are left out; a missing Ile class is averaged from the
+    two- and four-fold classes. Values are clipped to 20..61."""
+    onehot, degeneracy = _families()
+    counts = counts[:, :64].astype(float)
+    totals = counts @ onehot
+    squares = (counts**2) @ onehot
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        homozygosity = (squares - totals) / (totals * (totals - 1))
+    homozygosity[totals < 2] = numpy.nan
+
+    means = {}
+    with numpy.errstate(invalid="ignore"):
+        for fold in ENC_CLASSES:
+            family = homozygosity[:, degeneracy == fold]
+            seen = (~numpy.isnan(family)).sum(axis=1)
+            means[fold] = numpy.where(
+                seen > 0,
+                numpy.nansum(family, axis=1) / numpy.maximum(seen, 1),
+                numpy.nan,
+            )
+    means[3] = numpy.where(numpy.isnan(means[3]), (means[2] + means[4]) / 2, means[3])
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        enc = sum(
+            amino_acids / means[fold] for fold, amino_acids in ENC_CLASSES.items()
+        )
+    return numpy.clip(enc + 2, 20, 61)
+
+
+def codon_metrics(sequences, table, window=16):
+    """Codon usage summary of a batch of DNA sequences against a codon table.
+
+    Returns {metric: numpy array with one value per sequence} for METRICS:
+    codon adaptation index (Sharp & Li 1987), frequency of optimal codons (the
+    most used codon of every amino acid), GC and GC3 content, effective number
+    of codons and mean, minimum and maximum of the %MinMax profile. All values
+    come from one codon count matrix and one batched profile, so thousands of
+    sequences are scored at once."""
+    table = CodonTable.coerce(table)
+    sequences = [str(sequence) for sequence in sequences]
+    log_weights, optimal, counted = _weights(table)
+
+    codons, offsets = encode_codons_many(sequences)
+    counts = _counts(codons, offsets)
+    used = counts @ counted
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        metrics = {
+            "cai": numpy.exp((counts @ log_weights) / used),
+            "fop": (counts @ optimal) / used,
+            "gc": _gc_content(sequences),
+            "gc3": (counts @ _GC) / counts[:, :64].sum(axis=1),
+            "enc": effective_number_of_codons(counts),
+        }
+    metrics["cai"][used == 0] = numpy.nan
+
+    summary = _minmax_summary(codons, offsets, table, window)
+    metrics["minmax_mean"], metrics["minmax_min"], metrics["minmax_max"] = summary.T
+
+    return metrics
+
+
+def metrics_rows(metrics, digits=3):
+    """Splits codon_metrics into one {metric: float or None} dict per sequence"""
+    columns = [metrics[name].tolist() for name in METRICS]
+    return [
+        {
+            name: None if math.isnan(value) else round(value, digits)
+            for name, value in zip(METRICS, values)
+        }
+        for values in zip(*columns)
+    ]
@@ -1,20 +1,44 @@
 # cSpell: disable
-import re
-import pandas
-import matplotlib.pyplot as plt
-from flask import url_for
-from seqflask.utils import sequence_match, get_codon, GlobalVariables, make_plot_path
-
-plt.switch_backend("Agg")
+import numpy
+from seqflask.utils import only_characters, GlobalVariables
+from seqflask.tables import CodonTable
+from seqflask.encoding import encode_codons_many
+from seqflask.cutsites import get_scanner
+from seqflask.recoding import recode_site, remove_cutsites
+from seqflask.profiles import codon_profile
+from seqflask.optimizer import optimize_codons
+from seqflask.kmers import kmer_counts, top_kmers
+from seqflask.primers import design_primers, melting_temperature as nearest_neighbor_tm
+from seqflask.metrics import codon_metrics, metrics_rows
+from seqflask.harmonization import (
+    HARMONIZATION_MODES,
+    harmonize_codons,
+    harmonize_codons_many,
+)
+from seqflask.plots.utils import plot_key, plot_store, plot_title
+from seqflask.instrumentation import count
+
+PROTEIN_CHARACTERS = b"*?GALMFWKQESPVICYHRNDTX"
+DNA_CHARACTERS = b"ACTGNUSW"
 
 
 class Sequence:
     """Biological sequence object"""
 
+    __slots__ = ("sequence_id", "_sequence")
+
     def __init__(self, sequence_id, sequence, logger=None):
         self.sequence_id = sequence_id
         self.sequence = sequence.upper()
 
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @sequence.setter
+    def sequence(self, string):
+        self._sequence = string
+
     def __repr__(self):
         return f"Sequence: >{self.sequence_id} {self.sequence}"
 
@@ -32,6 +56,8 @@ class Sequence:
         return f">{self.sequence_id}\n\r{self.sequence}\n"
 
     def kmer_analysis(self, threshold, length=8):
+        """Returns [(kmer, count)] of k-mers occurring more than threshold times,
+        most frequent first"""
         kmers = {}
         for i in range(len(self) - length + 1):
             kmer = self.sequence[i : i + length]
@@ -47,6 +73,8 @@ class Sequence:
 class Protein(Sequence):
     """PROTEIN sequence object"""
 
+    __slots__ = ()
+
     def __init__(self, sequence_id, sequence):
         super().__init__(sequence_id, sequence)
 
@@ -62,8 +90,7 @@ class Protein(Sequence):
 
     @sequence.setter
     def sequence(self, string):
-        allowed_characters = re.compile(r"[^\*\?GALMFWKQESPVICYHRNDTX]")
-        if not sequence_match(string, allowed_characters.search):
+        if not only_characters(string, PROTEIN_CHARACTERS):
             raise ValueError(
                 f'>{self.sequence_id} :: includes forbidden character(s)! Allowed characters: "GALMFWKQESPVICYHRNDTX?*"'
             )
@@ -71,24 +98,23 @@ class Protein(Sequence):
 
     def reverse_translate(self, table, maximum=False):
         """Returns optimized DNA sequence"""
-        dna_sequence = list()
+        table = CodonTable.coerce(table)
         if maximum:
             name = "|NUC-MAX"
         else:
             name = "|NUC"
-        for amino in self.sequence:
-            if amino in "?X":
-                dna_sequence.append("NNN")
-            else:
-                codons = table.loc[amino]
-                dna_sequence.append(get_codon(codons, maximum=maximum))
 
-        return Nucleotide(f"{self.sequence_id}{name}", "".join(dna_sequence))
+        return Nucleotide(
+            f"{self.sequence_id}{name}",
+            table.reverse_translate(self.sequence, maximum=maximum),
+        )
 
 
 class Nucleotide(Sequence):
     """NUCLEOTIDE sequence object"""
 
+    __slots__ = ()
+
     def __init__(self, sequence_id, sequence, logger=None):
         super().__init__(sequence_id, sequence, logger)
 
@@ -104,13 +130,19 @@ class Nucleotide(Sequence):
 
     @sequence.setter
     def sequence(self, string):
-        allowed_characters = re.compile(r"[^ACTGNUSW]")
-        if not sequence_match(string, allowed_characters.search):
+        if not only_characters(string, DNA_CHARACTERS):
             raise ValueError(
                 f'>{self.sequence_id} :: includes forbidden character(s)! Allowed characters: "ACTGN"'
             )
         self._sequence = string
 
+    def kmer_analysis(self, threshold, length=8, number=None, canonical=False):
+        """Returns [(kmer, count)] of k-mers occurring more than threshold times,
+        most frequent first. Counted on 2-bit codes by seqflask.kmers; with
+        canonical a k-mer and its reverse complement are counted together."""
+        counts = kmer_counts(self.sequence, (length,), canonical=canonical)
+        return top_kmers(counts[length], length, number=number, threshold=threshold)
+
     @property
     def basic_cds(self):
         """Returns True if sequence is CDS or false if its not"""
@@ -118,7 +150,7 @@ class Nucleotide(Sequence):
             return True
         return False
 
-    def check_cds(self):
+    def check_cds(self, table):
         """Checks CDS"""
 
         def triplet(self):
@@ -127,21 +159,18 @@ class Nucleotide(Sequence):
         def start(self):
             return self.sequence[:3] == "ATG"
 
-        def stop(self):
-            prot = self.translate(check=True)
-            return prot.sequence[-1] == "*"
+        def stop(self, prot):
+            return prot.sequence[-1:] == "*"
 
-        def no_internal_stop(self):
-            prot = self.translate(check=True)
+        def no_internal_stop(self, prot):
             return not "*" in prot.sequence[:-1]
 
-        tests = [triplet, start, stop, no_internal_stop]
-        result = True
-        for test in tests:
-            if not test(self):
-                result = False
+        if not (triplet(self) and start(self)):
+            return False
 
-        return result
+        prot = self.translate(table=table, check=True)
+
+        return stop(self, prot) and no_internal_stop(self, prot)
 
     @property
     def reverse_complement(self):
@@ -158,7 +187,7 @@ class Nucleotide(Sequence):
             for start in range(0, len(self.sequence), 3)
         ]
 
-    def melting_temperature(self):
+    def melting_temperature(self, method="wallace", **conditions):
         """Calculate and return the Tm using the "Wallace rule".
 
         Tm = 4°C * (G+C) + 2°C * (A+T)
@@ -168,13 +197,31 @@ class Nucleotide(Sequence):
         Tm calculations for primers of 14 to 20 nt length.
 
         Non-dNA characters (e.g. E, F, J, !, 1, etc) are ignored in this method.
+
+        method="nearest-neighbor" uses seqflask.primers.melting_temperature
+        instead (salt and primer concentrations as keyword conditions).
         """
+        if method == "nearest-neighbor":
+            return nearest_neighbor_tm(self.sequence, **conditions)
+        if method != "wallace":
+            raise ValueError(f"Unknown Tm method: {method}")
+
         weak = ("A", "T", "W")
         strong = ("C", "G", "S")
         return 2 * sum(map(self.sequence.count, weak)) + 4 * sum(
             map(self.sequence.count, strong)
         )
 
+    def codon_metrics(self, table, window=16):
+        """Returns {metric: value or None} of the sequence, see
+        seqflask.metrics.codon_metrics"""
+        return metrics_rows(codon_metrics([self.sequence], table, window=window))[0]
+
+    def design_primers(self, **options):
+        """Returns (forward, reverse) primers amplifying the sequence, see
+        seqflask.primers.design_primers"""
+        return design_primers(self.sequence, **options)
+
     def translate(self, table, check=False):
         """Translate DNA sequence in PROTEIN sequence"""
         # self.logger.debug('Making translation...')
@@ -184,58 +231,63 @@ class Nucleotide(Sequence):
                     return self
                 else:
                     pass
-        seq_id = self.sequence_id
-        translation = list()
-        table = table.reset_index(level="Triplet")
-        for triplet in self.make_triplets():
-            if len(triplet) == 3 and "N" not in triplet:
-                translation.append(table[table["Triplet"] == triplet].index[0])
-            else:
-                translation.append("?")
+        table = CodonTable.coerce(table)
 
-        return Protein(f"{seq_id}|PROT", "".join(translation))
+        return Protein(f"{self.sequence_id}|PROT", table.translate(self.sequence))
 
-    def recode_sequence(self, replace, table, maximum=False):
+    def recode_sequence(self, replace, table, maximum=False, position=None):
         """Recode a sequence to replace certain sequences using a given codon table."""
-        position = self.sequence.find(replace)
+        table = CodonTable.coerce(table)
+        if position is None:
+            position = self.sequence.find(replace)
         if position < 0:
             return self
-        position -= position % 3
-        for i in range(position, position + (len(replace) // 3 + 1) * 3, 3):
-            codon = self.sequence[i : i + 3]
-            options = table.loc[table.xs(codon, level=1).index[0]]
-            if options.shape[0] == 1:
-                continue
-            if options.shape[0] > 0:
-                new_codon = get_codon(
-                    options, maximum=maximum, recode=True, skip=[codon]
-                )
-                break
+
+        buffer = bytearray(self.sequence.encode())
+        scanner = get_scanner([replace])
+        if recode_site(buffer, position, replace, table, scanner, maximum) is None:
+            return self
+
         if "|REC" not in self.sequence_id:
             self.sequence_id += "|REC"
-        self.sequence = f"{self.sequence[:i]}{new_codon}{self.sequence[i+3:]}"
+        self.sequence = buffer.decode()
 
         return self
 
-    def remove_cutsites(self, table, renz=GlobalVariables.RESTRICTION_ENZYMES):
-        """Remove recognition sites for restriction enzymes."""
-        changes = 0
-        for cutsite in renz:
-            while cutsite in self.sequence:
-                changes += 1
-                self = self.recode_sequence(cutsite, table=table)
-        print(changes)
-        return self
+    def remove_cutsites(
+        self, table, renz=GlobalVariables.RESTRICTION_ENZYMES, maximum=False
+    ):
+        """Remove recognition sites for restriction enzymes on both strands.
+        Use seqflask.recoding.remove_cutsites for the list of mutations."""
+        result = remove_cutsites(
+            self.sequence, CodonTable.coerce(table), renz, maximum=maximum
+        )
+        if not result.mutations:
+            return self
+        count("cutsites_removed_total", len(result.mutations))
+
+        seq_id = self.sequence_id
+        if "|REC" not in seq_id:
+            seq_id += "|REC"
 
-    def optimize_codon_usage(self, table, maximum=False):
-        """Optimize codon usage of a given DNA sequence"""
+        return Nucleotide(seq_id, result.sequence)
+
+    def optimize_codon_usage(self, table, maximum=False, beam_width=0):
+        """Optimize codon usage of a given DNA sequence. With a beam_width the
+        codons are chosen by seqflask.optimizer.optimize_codons, which also
+        keeps G/C content, homopolymers and cutsites in check."""
         if not self.basic_cds:
             return self
 
         seq_id = self.sequence_id
-        optimized = self.translate(table=table).reverse_translate(
-            table=table, maximum=maximum
-        )
+        protein = self.translate(table=table)
+        if beam_width:
+            optimized = optimize_codons(
+                protein.sequence, table, beam_width=beam_width, maximum=maximum
+            )
+            return Nucleotide(f"{seq_id}|OPT", optimized)
+
+        optimized = protein.reverse_translate(table=table, maximum=maximum)
 
         return Nucleotide(f"{seq_id}|OPT", optimized.sequence)
 
@@ -258,47 +310,13 @@ class Nucleotide(Sequence):
     def harmonize(self, source, table, mode=0):
         """Optimize codon usage of a given DNA sequence
         mode: 0 for closest frequency; 1 for same index"""
-        if not self.basic_cds:
+        if not self.basic_cds or mode not in HARMONIZATION_MODES:
             return self
 
-        seq_id = self.sequence_id
-        optimized = list()
-
-        for amino, triplet in zip(
-            self.translate(table=table).sequence, self.make_triplets()
-        ):
-            if amino == "?":
-                optimized.append("NNN")
-            else:
-                codons = table.loc[amino]
-                source_codons = source.loc[amino]
-                sorted_codons_frac = sorted(codons["Fraction"])
-                source_codon_frac = source_codons.loc[triplet]["Fraction"]
-
-                if mode == 0:
-                    best, freq = 1, 0
-                    for cod in sorted_codons_frac:
-                        current_best = abs(cod - source_codon_frac)
-                        if current_best < best:
-                            best, freq = current_best, cod
-
-                    closest_freq_codon = codons[codons["Fraction"] == freq].index[0]
-                    optimized.append(closest_freq_codon)
-
-                elif mode == 1:
-                    sorted_source_codons = sorted(source_codons["Fraction"])
-                    source_codon_index = sorted_source_codons.index(
-                        source_codons.loc[amino]["Fraction"]
-                    )
-                    same_index_codon = codons[
-                        codons["Fraction"] == sorted_codons_frac[source_codon_index]
-                    ].index[0]
-                    optimized.append(same_index_codon)
-
-                else:
-                    return self
-
-        return Nucleotide(f"{seq_id}|HARM{mode}", "".join(optimized))
+        return Nucleotide(
+            f"{self.sequence_id}|HARM{mode}",
+            harmonize_codons(self.sequence, source=source, table=table, mode=mode),
+        )
 
     def plot_codon_usage(
         self,
@@ -309,215 +327,78 @@ class Nucleotide(Sequence):
         table_other=None,
         minmax=True,
         target_organism="Yarrowia lipolytica",
-        n=0,
     ):
-        """Graph codon frequency of a given gene"""
-
-        def data_fraction(self, table=table, window=window):
-            """Calculates average window codon fraction for a given sequence and codon usage table.
-            Returns a list of window-fraction values, which can be used for analysis or ploted."""
-
-            values, data = [], []
-            codons = table.reset_index().set_index(["Triplet"])
-
-            for triplet in self.make_triplets():
-                values.append(codons.loc[triplet]["Fraction"])
-
-            for n in range(len(values) + 1 - window):
-                data.append(sum([f for f in values[n : n + window]]) / window)
-
-            return data
+        """Graph codon frequency of a given gene. Profiles are computed once per
+        unique input and kept in the app's plot store, where they are drawn by
+        the browser or rendered into an image on request; returns the plot key."""
+        if not self.basic_cds:
+            return
 
-        def data_minmax(self, table=table, window=window):
-            """Calculates the %MinMax values for a given sequence and codon usage table.
-            Returns a list of %MinMax values, which can be used for analysis or ploted.
+        panels = [(self, CodonTable.coerce(table), target_organism)]
+        if isinstance(other, Nucleotide) and other.basic_cds:
+            panels.append(
+                (other, CodonTable.coerce(table_other), other_id or target_organism)
+            )
 
-            Reference:
-            Clarke TF IV, Clark PL (2008) Rare Codons Cluster. PLoS ONE 3(10): e3412.
-            doi:10.1371/journal.pone.0003412"""
+        key = plot_key(
+            window,
+            minmax,
+            *[(seq.sequence_id, seq.sequence, t.digest, org) for seq, t, org in panels],
+        )
+        store = plot_store()
+        if key not in store:
+            store.put(
+                key,
+                {
+                    "window": window,
+                    "minmax": minmax,
+                    "panels": [
+                        {
+                            "title": plot_title(seq.sequence_id, org),
+                            "values": numpy.nan_to_num(
+                                codon_profile(seq, t, window=window, minmax=minmax)
+                            ).astype(numpy.float32),
+                        }
+                        for seq, t, org in panels
+                    ],
+                },
+            )
 
-            tri_table = table.reset_index(level="Triplet")
-            values, data = [], []
+        return key
 
-            for triplet in self.make_triplets():
-                freq = tri_table[tri_table["Triplet"] == triplet]["Frequency"][0]
-                codons = table.loc[tri_table[tri_table["Triplet"] == triplet].index[0]]
 
-                values.append(
-                    (
-                        freq,
-                        max(codons.Frequency),
-                        min(codons.Frequency),
-                        sum(codons.Frequency) / len(codons),
-                    )
-                )
+def translate_many(sequences, table, check=False):
+    """Translate a batch of DNA sequences with a single codon lookup.
+    Sequences that Nucleotide.translate would skip are returned unchanged."""
+    table = CodonTable.coerce(table)
+    selected = [
+        n
+        for n, seq in enumerate(sequences)
+        if check or seq.basic_cds or "FORCED" in seq.sequence_id
+    ]
+    codons, offsets = encode_codons_many([sequences[n].sequence for n in selected])
+    proteins = table.translate_codons(codons)
 
-            for n in range(len(values) + 1 - window):
-                current = values[n : n + window]
-                actual = sum([f[0] for f in current]) / window
-                maximum = sum([f[1] for f in current]) / window
-                minimum = sum([f[2] for f in current]) / window
-                average = sum([f[3] for f in current]) / window
+    translated = list(sequences)
+    for n, start, end in zip(selected, offsets[:-1], offsets[1:]):
+        translated[n] = Protein(f"{sequences[n].sequence_id}|PROT", proteins[start:end])
 
-                maxi = ((actual - average) / (maximum - average)) * 100
-                mini = ((average - actual) / (average - minimum)) * 100
+    return translated
 
-                if maxi > 0:
-                    data.append(maxi)
-                elif mini > 0:
-                    data.append(-mini)
 
-            return data
+def harmonize_many(sequences, source, table, mode=0):
+    """Harmonize a batch of DNA sequences with one precompiled codon map.
+    Sequences that Nucleotide.harmonize would skip are returned unchanged."""
+    if mode not in HARMONIZATION_MODES:
+        return list(sequences)
 
-        if not self.basic_cds:
-            return
+    selected = [n for n, seq in enumerate(sequences) if seq.basic_cds]
+    harmonized = harmonize_codons_many(
+        [sequences[n].sequence for n in selected], source=source, table=table, mode=mode
+    )
 
-        if isinstance(other, Nucleotide) and other.basic_cds:
-            if minmax:
-                data = [
-                    x
-                    for x in zip(
-                        data_minmax(self=self, table=table, window=window),
-                        data_minmax(self=other, table=table_other, window=window),
-                    )
-                ]
-            else:
-                data = [
-                    x
-                    for x in zip(
-                        data_fraction(self=self, table=table, window=window),
-                        data_fraction(self=other, table=table_other, window=window),
-                    )
-                ]
-        else:
-            if minmax:
-                data = data_minmax(self=self, table=table, window=window)
-            else:
-                data = data_fraction(self=self, table=table, window=window)
-
-        x = range(len(data))
-        zeros = [0 for i in x]
-
-        if other:
-            y1 = [i[0] for i in data]
-            y2 = [i[1] for i in data]
-            _, (ax0, ax1) = plt.subplots(2, 1, sharex=True, figsize=(12, 5))
-            plt.subplots_adjust(left=0.08, right=0.98, hspace=0.5)
-
-            ax0.plot(x, y1, alpha=0.8, linewidth=0.5)
-            if len(target_organism.split()) > 1:
-                ax0.set_title(
-                    f"Codon usage plot for {self.sequence_id} in ${target_organism.split()[0]}$ ${target_organism.split()[1]}$"
-                )
-            else:
-                ax0.set_title(
-                    f"Codon usage plot for {self.sequence_id} in ${target_organism}$"
-                )
-
-            if minmax:
-                ax0.set_ylim(-100, 100)
-                ax0.axhline(0, color="black", linewidth=0.5)
-                ax0.fill_between(
-                    x,
-                    y1,
-                    zeros,
-                    where=[True if y > 0 else False for y in y1],
-                    alpha=0.5,
-                    interpolate=True,
-                    color="C0",
-                )
-                ax0.fill_between(
-                    x,
-                    y1,
-                    zeros,
-                    where=[True if y < 0 else False for y in y1],
-                    alpha=0.5,
-                    interpolate=True,
-                    color="C2",
-                )
-                ax0.set_ylabel("%MinMax Value")
-            else:
-                ax0.set_ylabel("Fraction")
-
-            if other_id:
-                target_organism = other_id
-
-            ax1.plot(x, y2, alpha=0.8, linewidth=0.5)
-            if len(target_organism.split()) > 1:
-                ax1.set_title(
-                    f"Codon usage plot for {other.sequence_id} in ${target_organism.split()[0]}$ ${target_organism.split()[1]}$"
-                )
-            else:
-                ax1.set_title(
-                    f"Codon usage plot for {other.sequence_id} in ${target_organism}$"
-                )
-
-            if minmax:
-                ax1.set_ylim(-100, 100)
-                ax1.axhline(0, color="black", linewidth=0.5)
-                ax1.fill_between(
-                    x,
-                    y2,
-                    zeros,
-                    where=[True if y > 0 else False for y in y2],
-                    alpha=0.5,
-                    interpolate=True,
-                    color="C0",
-                )
-                ax1.fill_between(
-                    x,
-                    y2,
-                    zeros,
-                    where=[True if y < 0 else False for y in y2],
-                    alpha=0.5,
-                    interpolate=True,
-                    color="C2",
-                )
-                ax1.set_ylabel("%MinMax Value")
-            else:
-                ax1.set_ylabel("Fraction")
+    result = list(sequences)
+    for n, sequence in zip(selected, harmonized):
+        result[n] = Nucleotide(f"{sequences[n].sequence_id}|HARM{mode}", sequence)
 
-        else:
-            _, ax = plt.subplots(1, 1, figsize=(12, 2))
-            plt.subplots_adjust(left=0.08, right=0.98, bottom=0.25)
-            ax.plot(x, data, alpha=0.8, linewidth=0.5)
-            if len(target_organism.split()) > 1:
-                ax.set_title(
-                    f"Codon usage plot for {self.sequence_id} in ${target_organism.split()[0]}$ ${target_organism.split()[1]}$"
-                )
-            else:
-                ax.set_title(
-                    f"Codon usage plot for {self.sequence_id} in ${target_organism}$"
-                )
-
-            if minmax:
-                ax.set_ylim(-100, 100)
-                ax.axhline(0, color="black", linewidth=0.5)
-                ax.fill_between(
-                    x,
-                    data,
-                    zeros,
-                    where=[True if y > 0 else False for y in data],
-                    alpha=0.5,
-                    interpolate=True,
-                    color="C0",
-                )
-                ax.fill_between(
-                    x,
-                    data,
-                    zeros,
-                    where=[True if y < 0 else False for y in data],
-                    alpha=0.5,
-                    interpolate=True,
-                    color="C2",
-                )
-                ax.set_ylabel("%MinMax Value")
-            else:
-                ax.set_ylabel("Fraction")
-
-        plt.xlim(-4, len(data) + 4)
-        plt.xlabel("Codon")
-
-        plt.savefig(make_plot_path(n))
-
-        return 0
+    return result
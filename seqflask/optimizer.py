@@ -0,0 +1,148 @@
+# cSpell: disable
+import heapq
+import math
+from functools import lru_cache
+import numpy
+from seqflask.utils import GlobalVariables
+from seqflask.tables import CodonTable
+from seqflask.encoding import NUCLEOTIDES
+from seqflask.cutsites import get_scanner
+
+# Score penalties: per G/C base outside the window bounds, per base of a
+# homopolymer above the limit and per recognition site
+GC_PENALTY = 0.5
+HOMOPOLYMER_PENALTY = 5.0
+SITE_PENALTY = 100.0
+
+# Beam width of the penalized search when it is asked for without one
+DEFAULT_BEAM_WIDTH = 8
+
+
+def _score(hypothesis):
+    return hypothesis[0]
+
+
+@lru_cache(maxsize=64)
+def _candidates(table):
+    """Per amino acid: (codon index, base codes, G/C count, log relative
+    adaptiveness) of every codon that is used at all"""
+    weights = numpy.nan_to_num(table.fraction)
+    candidates = []
+    for start, end in zip(table.starts, table.ends):
+        group = table.order[start:end]
+        best = weights[group].max()
+        codons = []
+        for codon in group:
+            triplet = table.codons[codon]
+            if best > 0 and weights[codon] <= 0:
+                continue
+            score = math.log(weights[codon] / best) if best > 0 else 0.0
+            codons.append(
+                (
+                    int(codon),
+                    tuple(NUCLEOTIDES.index(base) for base in triplet),
+                    triplet.count("G") + triplet.count("C"),
+                    score,
+                )
+            )
+        candidates.append(codons)
+    return candidates
+
+
+def optimize_codons(
+    protein,
+    table,
+    beam_width=DEFAULT_BEAM_WIDTH,
+    maximum=False,
+    gc_window=48,
+    gc_bounds=(0.3, 0.7),
+    homopolymer=8,
+    sites=GlobalVariables.RESTRICTION_ENZYMES,
+    rng=None,
+):
+    """Reverse-translates a protein with a beam search over codons.
+
+    Every hypothesis is scored in one pass on codon usage (log of the codon
+    fraction relative to the best synonymous codon), G/C content of the last
+    gc_window bases, homopolymers longer than homopolymer and recognition sites
+    on both strands. Only the beam_width best hypotheses are extended, so time
+    is linear in the protein length. Unless maximum is set, Gumbel noise is
+    added to the codon scores, which without constraints samples codons in
+    proportion to their fraction like CodonTable.reverse_translate does.
+    Unknown residues become NNN."""
+    table = CodonTable.coerce(table)
+    candidates = _candidates(table)
+    scanner = get_scanner(sites)
+    transitions, outputs = scanner.transitions, scanner.outputs
+    window = max(gc_window // 3, 1)
+    gc_low, gc_high = gc_bounds[0] * 3 * window, gc_bounds[1] * 3 * window
+
+    residues = table.residue_index[numpy.frombuffer(protein.encode(), numpy.uint8)]
+    if maximum:
+        noise = numpy.zeros((len(residues), 6))
+    else:
+        noise = (rng or numpy.random.default_rng()).gumbel(size=(len(residues), 6))
+
+    # Hypothesis: (score, automaton state, last base, its run, G/C counts of
+    # the last codons, their sum, index of the hypothesis it extends, codon)
+    beam = [(0.0, 0, -1, 0, (), 0, -1, 64)]
+    steps = []
+    for position, amino in enumerate(residues.tolist()):
+        expanded = []
+        codons = candidates[amino] if amino != 255 else [(64, (4, 4, 4), 0, 0.0)]
+        gumbel = noise[position].tolist()
+        for parent, (score, node, last, run, counts, total, _, _) in enumerate(beam):
+            for n, (codon, bases, gc, usage) in enumerate(codons):
+                penalty, state, base, length = 0.0, node, last, run
+                for code in bases:
+                    state = transitions[state][code]
+                    if outputs[state]:
+                        penalty += SITE_PENALTY * len(outputs[state])
+                    length = length + 1 if code == base and code != 4 else 1
+                    base = code
+                    if length > homopolymer:
+                        penalty += HOMOPOLYMER_PENALTY
+
+                window_counts = counts + (gc,)
+                window_total = total + gc
+                if len(window_counts) > window:
+                    window_total -= window_counts[0]
+                    window_counts = window_counts[1:]
+                if len(window_counts) == window:
+                    if window_total < gc_low:
+                        penalty += GC_PENALTY * (gc_low - window_total)
+                    elif window_total > gc_high:
+                        penalty += GC_PENALTY * (window_total - gc_high)
+
+                expanded.append(
+                    (
+                        score + usage + gumbel[n] - penalty,
+                        state,
+                        base,
+                        length,
+                        window_counts,
+                        window_total,
+                        parent,
+                        codon,
+                    )
+                )
+
+        # Of hypotheses with the same automaton state, homopolymer run and G/C
+        # sum only the best is kept, so the beam does not fill with near copies
+        beam, seen = [], set()
+        for hypothesis in heapq.nlargest(len(expanded), expanded, key=_score):
+            if hypothesis[1:4] + hypothesis[5:6] not in seen:
+                seen.add(hypothesis[1:4] + hypothesis[5:6])
+                beam.append(hypothesis)
+                if len(beam) == beam_width:
+                    break
+        steps.append([(h[6], h[7]) for h in beam])
+
+    indices, best = [], 0
+    for step in reversed(steps):
+        parent, codon = step[best]
+        indices.append(codon)
+        best = parent
+    indices.reverse()
+
+    return table.codon_bytes[numpy.array(indices, dtype=numpy.intp)].tobytes().decode()
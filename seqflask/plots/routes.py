@@ -0,0 +1,54 @@
+from flask import Blueprint, abort, jsonify, make_response, request
+from seqflask.plots.utils import PLOT_FORMATS, plot_store, plot_data
+from seqflask.instrumentation import span
+
+plots = Blueprint("plots", __name__)
+
+
+def cached_response(response, key):
+    """Plots are content addressed, so responses never change"""
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.set_etag(key)
+
+    return response.make_conditional(request)
+
+
+@plots.app_template_global("plot_series_data")
+def plot_series_data(key):
+    """Plot data of a key for inlining in a page, None if it is unknown"""
+    plot = plot_store().get(key)
+    return plot_data(plot) if plot is not None else None
+
+
+@plots.route("/plots/<key>.<any(json, f32):fmt>")
+def plot_series(key, fmt):
+    plot = plot_store().get(key)
+    if plot is None:
+        abort(404)
+
+    if fmt == "json":
+        return cached_response(jsonify(plot_data(plot)), f"{key}.{fmt}")
+
+    # Raw little-endian float32 values of all panels, one after another
+    response = make_response(
+        b"".join(p["values"].astype("<f4").tobytes() for p in plot["panels"])
+    )
+    response.mimetype = "application/octet-stream"
+    response.headers["X-Panel-Lengths"] = ",".join(
+        str(len(p["values"])) for p in plot["panels"]
+    )
+
+    return cached_response(response, f"{key}.{fmt}")
+
+
+@plots.route("/plots/<key>.<any(png, svg):fmt>")
+def plot_image(key, fmt):
+    with span("render_plot"):
+        data = plot_store().image(key, fmt=fmt)
+    if data is None:
+        abort(404)
+
+    response = make_response(data)
+    response.mimetype = PLOT_FORMATS[fmt]
+
+    return cached_response(response, f"{key}.{fmt}")
@@ -0,0 +1,248 @@
+# cSpell: disable
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy
+from flask import current_app
+from seqflask.instrumentation import count
+
+PLOT_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Plot keys are sha256 hex digests (see plot_key)
+KEY = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PlotStore:
+    """Bounded in-memory LRU of plots keyed by a hash of their input.
+
+    Every entry holds the plot data (profile series, titles and mode), which is
+    served to the browser as is, and the images rendered from it on request.
+    With a directory, plots and images are also written there as files named by
+    their key, so every process (e.g. gunicorn worker) finds plots made by the
+    others and plots dropped from memory; the least recently used beyond
+    disk_size are deleted."""
+
+    def __init__(self, maxsize=256, directory=None, disk_size=10000):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.disk_size = disk_size
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "renders": 0}
+        self._plots = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(
+            app.config.get("PLOT_CACHE_SIZE", 256),
+            directory=app.config.get("PLOT_DIRECTORY")
+            or os.path.join(app.instance_path, "plots"),
+            disk_size=app.config.get("PLOT_STORE_SIZE", 10000),
+        )
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._plots:
+                return True
+        path = self._path(key, "json")
+        return path is not None and os.path.exists(path)
+
+    def __len__(self):
+        return len(self._plots)
+
+    def _path(self, key, extension):
+        """File of a plot in directory, None without one or for a malformed key"""
+        if not self.directory or not KEY.match(key):
+            return None
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "wb") as handle:
+            handle.write(data)
+        os.replace(temporary, path)
+
+    def _read(self, path):
+        """File contents, marking the file as used, or None if it is missing"""
+        try:
+            with open(path, "rb") as handle:
+                data = handle.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _load(self, key):
+        path = self._path(key, "json")
+        data = path and self._read(path)
+        if not data:
+            return None
+        plot = json.loads(data)
+        for panel in plot["panels"]:
+            panel["values"] = numpy.array(panel["values"], dtype=numpy.float32)
+        with self._lock:
+            self.stats["loads"] += 1
+        return plot
+
+    def _prune(self):
+        """Deletes the least recently used plots beyond disk_size"""
+        names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        if len(names) <= self.disk_size:
+            return
+        paths = [os.path.join(self.directory, name) for name in names]
+        paths.sort(key=lambda path: os.path.getmtime(path), reverse=True)
+        for path in paths[self.disk_size :]:
+            key = os.path.basename(path)[: -len(".json")]
+            for extension in ["json", *PLOT_FORMATS]:
+                try:
+                    os.remove(self._path(key, extension))
+                except OSError:
+                    pass
+
+    def get(self, key):
+        """Returns stored plot data or None"""
+        with self._lock:
+            if key in self._plots:
+                self.stats["hits"] += 1
+                self._plots.move_to_end(key)
+                return self._plots[key]
+        plot = self._load(key)
+        if plot is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        return self._remember(key, plot)
+
+    def put(self, key, plot):
+        self._remember(key, plot)
+        path = self._path(key, "json")
+        if path is None:
+            return
+
+        data = dict(plot)
+        data["panels"] = [
+            dict(panel, values=numpy.asarray(panel["values"]).tolist())
+            for panel in plot["panels"]
+        ]
+        self._write(path, json.dumps(data).encode())
+        self._stores += 1
+        if self._stores % 100 == 0:
+            self._prune()
+
+    def _remember(self, key, plot):
+        entry = dict(plot, images={})
+        with self._lock:
+            self._plots[key] = entry
+            self._plots.move_to_end(key)
+            while len(self._plots) > self.maxsize:
+                self._plots.popitem(last=False)
+        return entry
+
+    def image(self, key, fmt="png"):
+        """Returns plot image bytes, rendering them at most once per format"""
+        plot = self.get(key)
+        if plot is None:
+            return None
+        if fmt not in plot["images"]:
+            path = self._path(key, fmt)
+            data = path and self._read(path)
+            if not data:
+                data = render_plot(
+                    [(panel["values"], panel["title"]) for panel in plot["panels"]],
+                    minmax=plot["minmax"],
+                    fmt=fmt,
+                )
+                with self._lock:
+                    self.stats["renders"] += 1
+                count("plots_rendered_total", format=fmt)
+                if path:
+                    self._write(path, data)
+            plot["images"][fmt] = data
+        return plot["images"][fmt]
+
+
+def plot_store(app=None):
+    """Returns plot store of the (current) app"""
+    app = app or current_app
+    if "plots" not in app.extensions:
+        app.extensions["plots"] = PlotStore.from_app(app)
+    return app.extensions["plots"]
+
+
+def plot_key(*parts):
+    """Content address of a plot made from parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def plot_title(sequence_id, organism):
+    """Plot title with the organism name in italic"""
+    if len(organism.split()) > 1:
+        genus, species = organism.split()[:2]
+        return f"Codon usage plot for {sequence_id} in ${genus}$ ${species}$"
+    return f"Codon usage plot for {sequence_id} in ${organism}$"
+
+
+def plot_data(plot):
+    """JSON-serializable plot data for drawing in the browser"""
+    return {
+        "window": plot["window"],
+        "minmax": plot["minmax"],
+        "panels": [
+            {
+                "title": panel["title"],
+                "values": numpy.round(panel["values"], 2).tolist(),
+            }
+            for panel in plot["panels"]
+        ],
+    }
+
+
+def render_plot(panels, minmax=True, fmt="png"):
+    """Render codon usage panels [(values, title), ...] and return the image bytes"""
+    # Plots are drawn in the browser by default, so matplotlib loads on first use
+    from matplotlib.figure import Figure
+
+    if len(panels) > 1:
+        figure = Figure(figsize=(12, 5))
+        axes = figure.subplots(len(panels), 1, sharex=True)
+        figure.subplots_adjust(left=0.08, right=0.98, hspace=0.5)
+    else:
+        figure = Figure(figsize=(12, 2))
+        axes = [figure.subplots(1, 1)]
+        figure.subplots_adjust(left=0.08, right=0.98, bottom=0.25)
+
+    for ax, (values, title) in zip(axes, panels):
+        x = range(len(values))
+        ax.plot(x, values, alpha=0.8, linewidth=0.5)
+        ax.set_title(title)
+
+        if minmax:
+            ax.set_ylim(-100, 100)
+            ax.axhline(0, color="black", linewidth=0.5)
+            ax.fill_between(
+                x, values, 0, where=values > 0, alpha=0.5, interpolate=True, color="C0"
+            )
+            ax.fill_between(
+                x, values, 0, where=values < 0, alpha=0.5, interpolate=True, color="C2"
+            )
+            ax.set_ylabel("%MinMax Value")
+        else:
+            ax.set_ylabel("Fraction")
+
+    length = max(len(values) for values, _ in panels)
+    axes[-1].set_xlim(-4, length + 4)
+    axes[-1].set_xlabel("Codon")
+
+    handle = io.BytesIO()
+    figure.savefig(handle, format=fmt)
+
+    return handle.getvalue()
@@ -0,0 +1,145 @@
+# cSpell: disable
+import math
+from collections import namedtuple
+import numpy
+from seqflask.encoding import encode_sequence
+from seqflask.cutsites import reverse_complement
+
+Primer = namedtuple("Primer", ["sequence", "tm", "gc"])
+
+# SantaLucia (1998) unified nearest-neighbor parameters of 5'-XY-3' stacks:
+# (dH kcal/mol, dS cal/K/mol)
+NEAREST_NEIGHBORS = {
+    "AA": (-7.9, -22.2),
+    "AC": (-8.4, -22.4),
+    "AG": (-7.8, -21.0),
+    "AT": (-7.2, -20.4),
+    "CA": (-8.5, -22.7),
+    "CC": (-8.0, -19.9),
+    "CG": (-10.6, -27.2),
+    "CT": (-7.8, -21.0),
+    "GA": (-8.2, -22.2),
+    "GC": (-9.8, -24.4),
+    "GG": (-8.0, -19.9),
+    "GT": (-8.4, -22.4),
+    "TA": (-7.2, -21.3),
+    "TC": (-8.2, -22.2),
+    "TG": (-8.5, -22.7),
+    "TT": (-7.9, -22.2),
+}
+# Initiation with a terminal A/T or G/C base pair, per terminal base
+INITIATION = {"A": (2.3, 4.1), "C": (0.1, -2.8), "G": (0.1, -2.8), "T": (2.3, 4.1)}
+
+GAS_CONSTANT = 1.9872
+
+_STACK_H = numpy.zeros(25)
+_STACK_S = numpy.zeros(25)
+for pair, (enthalpy, entropy) in NEAREST_NEIGHBORS.items():
+    code = "ACGT".index(pair[0]) * 5 + "ACGT".index(pair[1])
+    _STACK_H[code], _STACK_S[code] = enthalpy, entropy
+_INIT_H = numpy.array([INITIATION[base][0] for base in "ACGT"] + [0.0])
+_INIT_S = numpy.array([INITIATION[base][1] for base in "ACGT"] + [0.0])
+
+
+def _cumulative(sequence):
+    """Returns (codes, cumulative dH, cumulative dS, cumulative unknown bases)
+    of the stacks of a sequence, so any window is summed in constant time"""
+    codes = encode_sequence(sequence).astype(numpy.intp)
+    stacks = codes[:-1] * 5 + codes[1:]
+    enthalpy = numpy.concatenate(([0.0], numpy.cumsum(_STACK_H[stacks])))
+    entropy = numpy.concatenate(([0.0], numpy.cumsum(_STACK_S[stacks])))
+    unknown = numpy.concatenate(([0], numpy.cumsum(codes == 4)))
+    return codes, enthalpy, entropy, unknown
+
+
+def _tm(enthalpy, entropy, length, na, mg, dntp, concentration):
+    """Tm in °C from nearest-neighbor sums. Monovalent salt correction of
+    SantaLucia (1998) with Mg2+ as sodium equivalents (von Ahsen et al. 2001);
+    concentration is the primer concentration in nM."""
+    sodium = (na + 120 * math.sqrt(max(mg - dntp, 0.0))) / 1000
+    entropy = entropy + 0.368 * (length - 1) * math.log(sodium)
+    dna = GAS_CONSTANT * math.log(concentration * 1e-9 / 4)
+    return 1000 * enthalpy / (entropy + dna) - 273.15
+
+
+def window_tm(sequence, length, na=50.0, mg=0.0, dntp=0.0, concentration=250.0):
+    """Nearest-neighbor Tm of every window of a given length; element i is the
+    window starting at base i. Windows with unknown bases are NaN. Cumulative
+    stack sums make the whole scan O(n)."""
+    codes, enthalpy, entropy, unknown = _cumulative(sequence)
+    if length < 2 or length > len(codes):
+        return numpy.empty(0)
+
+    starts = numpy.arange(len(codes) - length + 1)
+    ends = starts + length
+    total_h = enthalpy[ends - 1] - enthalpy[starts]
+    total_h += _INIT_H[codes[starts]] + _INIT_H[codes[ends - 1]]
+    total_s = entropy[ends - 1] - entropy[starts]
+    total_s += _INIT_S[codes[starts]] + _INIT_S[codes[ends - 1]]
+
+    tms = _tm(total_h, total_s, length, na, mg, dntp, concentration)
+    tms[unknown[ends] != unknown[starts]] = numpy.nan
+    return tms
+
+
+def melting_temperature(sequence, **conditions):
+    """Nearest-neighbor Tm of a whole oligo (see window_tm for conditions)"""
+    tms = window_tm(sequence, len(sequence), **conditions)
+    return float(tms[0]) if len(tms) else float("nan")
+
+
+def _end_primer(sequence, target_tm, min_length, max_length, conditions):
+    """Best primer starting at the first base: every length is scored by its
+    distance from target_tm, plus 1 °C without a G/C clamp at the 3' end"""
+    prefix = sequence[:max_length]
+    codes, enthalpy, entropy, unknown = _cumulative(prefix)
+    lengths = numpy.arange(min_length, len(codes) + 1)
+    if not len(lengths):
+        return None
+
+    total_h = enthalpy[lengths - 1] + _INIT_H[codes[0]] + _INIT_H[codes[lengths - 1]]
+    total_s = entropy[lengths - 1] + _INIT_S[codes[0]] + _INIT_S[codes[lengths - 1]]
+    tms = _tm(total_h, total_s, lengths, **conditions)
+    clamp = (codes[lengths - 1] == 1) | (codes[lengths - 1] == 2)
+    score = numpy.abs(tms - target_tm) + ~clamp
+    score[unknown[lengths] > 0] = numpy.inf
+    if not numpy.isfinite(score).any():
+        return None
+
+    best = int(numpy.argmin(score))
+    primer = prefix[: lengths[best]]
+    gc = (primer.count("G") + primer.count("C")) / len(primer)
+    return Primer(primer, round(float(tms[best]), 1), round(gc, 2))
+
+
+def design_primers(
+    sequence,
+    target_tm=60.0,
+    min_length=18,
+    max_length=30,
+    na=50.0,
+    mg=0.0,
+    dntp=0.0,
+    concentration=250.0,
+):
+    """Returns (forward, reverse) Primers amplifying a whole sequence, e.g. a
+    part made by Nucleotide.make_part. Each primer has the length (min_length
+    to max_length) whose nearest-neighbor Tm is closest to target_tm, preferring
+    a G/C at its 3' end; None if the sequence is too short."""
+    sequence = str(sequence).upper()
+    conditions = {"na": na, "mg": mg, "dntp": dntp, "concentration": concentration}
+    return (
+        _end_primer(sequence, target_tm, min_length, max_length, conditions),
+        _end_primer(
+            reverse_complement(sequence[-max_length:]),
+            target_tm,
+            min_length,
+            max_length,
+            conditions,
+        ),
+    )
+
+
+def design_primers_many(sequences, **options):
+    """design_primers for a batch of sequences"""
+    return [design_primers(sequence, **options) for sequence in sequences]
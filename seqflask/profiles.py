@@ -0,0 +1,108 @@
+# cSpell: disable
+import numpy
+from seqflask.tables import CodonTable
+from seqflask.encoding import encode_codons_many
+
+
+def codon_values(table):
+    """Returns per-codon (fraction, frequency, max, min, average) vectors with a
+    65th all-zero entry for unknown codons"""
+    table = CodonTable.coerce(table)
+    return {
+        name: numpy.append(numpy.nan_to_num(values), 0.0)
+        for name, values in (
+            ("fraction", table.fraction),
+            ("frequency", table.frequency),
+            ("maximum", table.synonym_max),
+            ("minimum", table.synonym_min),
+            ("average", table.synonym_mean),
+        )
+    }
+
+
+def _check_windows(windows):
+    for window in windows:
+        if isinstance(window, bool) or not isinstance(window, (int, numpy.integer)):
+            raise ValueError(f"Window must be a whole number of codons: {window!r}")
+        if window < 1:
+            raise ValueError(f"Window must be at least 1 codon: {window}")
+
+
+def _window_means(cumulative, window):
+    """Mean of every window of codons from a prefix sum; empty if the codons do
+    not fill one window"""
+    if window >= len(cumulative):
+        return numpy.zeros(0)
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+
+def _minmax(actual, maximum, minimum, average):
+    """%MinMax from window means of actual, max, min and average frequencies.
+    Prefix-sum means carry rounding errors, so windows at the average (e.g. of
+    Met and Trp codons only, where max == average == min) are exactly 0."""
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        above = (actual - average) / (maximum - average) * 100
+        below = (average - actual) / (average - minimum) * 100
+    above[numpy.isclose(maximum, average)] = 0.0
+    below[numpy.isclose(average, minimum)] = 0.0
+    return numpy.where(
+        numpy.isclose(actual, average),
+        0.0,
+        numpy.where(actual > average, above, -below),
+    )
+
+
+def profile_series(codons, table, windows=(16,), minmax=True):
+    """{window: %MinMax (or average codon fraction) of every window of codons}
+    of an encoded codon array; element i is the window starting at codon i.
+    Windows must be at least 1 codon; longer ones than the array give empty
+    series."""
+    _check_windows(windows)
+    values = codon_values(table)
+    names = ("frequency", "maximum", "minimum", "average") if minmax else ("fraction",)
+    cumulative = {
+        name: numpy.concatenate(([0.0], numpy.cumsum(values[name][codons])))
+        for name in names
+    }
+
+    series = {}
+    for window in windows:
+        means = [_window_means(cumulative[name], window) for name in names]
+        series[window] = _minmax(*means) if minmax else means[0]
+
+    return series
+
+
+def codon_profiles(sequences, table, windows=(16,), minmax=True):
+    """Calculates %MinMax (or average codon fraction) profiles of many sequences.
+
+    Every codon is mapped to precomputed vectors and window means are taken
+    from prefix sums, so a profile is O(n) regardless of window size. Returns a
+    list with a {window: numpy array} dict per sequence.
+
+    Reference:
+    Clarke TF IV, Clark PL (2008) Rare Codons Cluster. PLoS ONE 3(10): e3412.
+    doi:10.1371/journal.pone.0003412"""
+    _check_windows(windows)
+    codons, offsets = encode_codons_many([str(sequence) for sequence in sequences])
+
+    # Window means over the concatenated batch; windows spanning two records
+    # are dropped when the profiles are split
+    series = profile_series(codons, table, windows, minmax)
+
+    profiles = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        profiles.append(
+            {
+                window: data[start : max(end - window + 1, start)]
+                for window, data in series.items()
+            }
+        )
+
+    return profiles
+
+
+def codon_profile(sequence, table, window=16, minmax=True):
+    """Calculates the %MinMax (or average codon fraction) profile of a sequence"""
+    (profile,) = codon_profiles([sequence], table, windows=(window,), minmax=minmax)
+    return profile[window]
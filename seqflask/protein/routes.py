@@ -1,10 +1,13 @@
 import os
-import time
-import requests
-from flask import Blueprint, render_template, url_for, flash, redirect
+from flask import Blueprint, current_app, render_template, url_for, flash, redirect
 from seqflask.modules import Protein
-from seqflask.utils import fasta_parser, load_codon_table, clean_old_plots
+from seqflask.utils import fasta_parser
+from seqflask.tables import load_codon_table
 from seqflask.protein.forms import proteinSequenceForm
+from seqflask.protein.utils import run_protein_operation
+from seqflask.primers import design_primers_many
+from seqflask.uniprot import UniProtError, parse_accessions, uniprot_client
+from seqflask.memo import result_cache
 
 
 protein = Blueprint("protein", __name__)
@@ -13,7 +16,6 @@ protein = Blueprint("protein", __name__)
 @protein.route("/protein", methods=["GET", "POST"])
 def protein_page():
     form = proteinSequenceForm()
-    clean_old_plots()
     if form.validate_on_submit():
         list_of_sequences = []
         if form.protein_sequence.data:
@@ -29,12 +31,19 @@ def protein_page():
                 flash("Ups, something went wrong :(", "danger")
                 return redirect(url_for("protein.protein_page"))
         elif form.uniprot_identifier.data:
-            uniprot_data = ""
-            for uniprot_identifier in str(form.uniprot_identifier.data).split(","):
-                uniprot_uri = f"https://www.uniprot.org/uniprot/{uniprot_identifier.replace(' ', '')}.fasta"
-                uniprot_response = requests.get(uniprot_uri)
-                uniprot_data += f"{uniprot_response.text[:-1]}*\n"
-                time.sleep(0.1)
+            accessions = parse_accessions(str(form.uniprot_identifier.data))
+            try:
+                entries, missing = uniprot_client().fetch(accessions)
+            except UniProtError as e:
+                flash(str(e), "danger")
+                return render_template("protein.html", title="Protein", form=form)
+            if missing and entries:
+                flash(f"404: {', '.join(missing)} not found!", "warning")
+            uniprot_data = "".join(
+                f"{entries[accession].rstrip()}*\n"
+                for accession in accessions
+                if accession in entries
+            )
             try:
                 list_of_sequences = [
                     Protein(rec[0], rec[1]) for rec in fasta_parser(uniprot_data)
@@ -51,30 +60,31 @@ def protein_page():
 
         CODON_TABLE = load_codon_table(taxonomy_id=form.target_organism.data)
 
+        plots, primers = [], []
         if form.reverse.data or form.golden_gate.data != "0000":
-            modified = [
-                single.reverse_translate(table=CODON_TABLE, maximum=form.maximize.data)
-                for single in list_of_sequences
-            ]
+            modified, recoded = run_protein_operation(
+                list_of_sequences,
+                table=CODON_TABLE,
+                maximize=form.maximize.data,
+                golden_gate=form.golden_gate.data,
+                cache=result_cache(),
+            )
             if form.golden_gate.data != "0000":
-                modified = [
-                    single.remove_cutsites(table=CODON_TABLE) for single in modified
-                ]
+                primers = design_primers_many(
+                    [single.sequence for single in modified],
+                    target_tm=current_app.config["PRIMER_TARGET_TM"],
+                )
             if form.plot.data:
                 for target in form.target_organism.choices:
                     if target[0] == form.target_organism.data:
                         target_organism_name = target[1]
-                for n, rec in enumerate(modified):
+                plots = [
                     rec.plot_codon_usage(
                         window=16,
                         table=CODON_TABLE,
                         target_organism=target_organism_name,
-                        n=n,
                     )
-            if form.golden_gate.data != "0000":
-                modified = [
-                    single.make_part(part_type=form.golden_gate.data, table=CODON_TABLE)
-                    for single in modified
+                    for rec in recoded
                 ]
         else:
             modified = False
@@ -90,6 +100,8 @@ def protein_page():
             title="PROTEIN",
             form=form,
             modified=modified,
+            plots=plots,
+            primers=primers,
             draw_plot=form.plot.data,
         )
 
@@ -0,0 +1,34 @@
+from seqflask.tables import CodonTable
+from seqflask.instrumentation import count
+
+
+def run_protein_operation(
+    list_of_sequences, table, maximize=False, golden_gate=None, cache=None
+):
+    """Reverse-translates protein sequences, optionally into GoldenGate parts.
+    Returns the modified sequences and the same sequences before they were made
+    into parts. Maximized runs that make no parts (those sample cutsite edits)
+    use cache (see run_dna_operation) if given."""
+    count("sequences_processed_total", len(list_of_sequences), operation="reverse")
+    compute = lambda batch: _run_protein_operation(batch, table, maximize, golden_gate)
+    if cache is None or not maximize or golden_gate not in (None, "0000"):
+        return compute(list_of_sequences)
+
+    options = ("protein", "reverse", CodonTable.coerce(table).digest)
+    return cache.run(list_of_sequences, options, compute)
+
+
+def _run_protein_operation(list_of_sequences, table, maximize, golden_gate):
+    recoded = [
+        single.reverse_translate(table=table, maximum=maximize)
+        for single in list_of_sequences
+    ]
+    if golden_gate in (None, "0000"):
+        return recoded, recoded
+
+    recoded = [single.remove_cutsites(table=table) for single in recoded]
+    modified = [
+        single.make_part(part_type=golden_gate, table=table) for single in recoded
+    ]
+
+    return modified, recoded
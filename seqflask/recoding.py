@@ -0,0 +1,67 @@
+# cSpell: disable
+from collections import namedtuple
+from seqflask.cutsites import get_scanner
+
+Mutation = namedtuple("Mutation", ["position", "old", "new"])
+RecodingResult = namedtuple("RecodingResult", ["sequence", "mutations", "unresolved"])
+
+
+def recode_site(buffer, position, site, table, scanner, maximum=False):
+    """Replaces one codon overlapping site (at position) in a mutable buffer with
+    a synonymous codon. Only the window around the edited codon is re-scanned and
+    an edit is accepted only if it removes the site without creating any other
+    site of the scanner. Returns a Mutation or None if no such edit exists."""
+    first = position - position % 3
+    last = position + len(site) - 1
+    reach = max(scanner.longest, len(site)) - 1
+
+    for i in range(first, last - last % 3 + 1, 3):
+        old = buffer[i : i + 3].decode()
+        amino = table.amino(old)
+        if amino is None:
+            continue
+
+        start, end = max(i - reach, 0), min(i + 3 + reach, len(buffer))
+        before = set(scanner.scan(buffer, start, end))
+        tried = [old]
+        while True:
+            new = table.get_codon(amino, maximum=maximum, skip=tried)
+            if new is None:
+                break
+            buffer[i : i + 3] = new.encode()
+            after = set(scanner.scan(buffer, start, end))
+            if (position, site) not in after and after <= before:
+                return Mutation(i, old, new)
+            buffer[i : i + 3] = old.encode()
+            tried.append(new)
+
+    return None
+
+
+def recode_sites(sequence, table, scanner, maximum=False, hits=None):
+    """Removes sites of a scanner from a CDS with synonymous codon changes.
+
+    Sites are fixed left to right in one pass over the initial hits. Since no
+    accepted edit creates a new site, every remaining site is one of the initial
+    hits, so the pass terminates after at most one attempt per hit and the
+    sites still present afterwards are exactly the unresolved ones."""
+    buffer = bytearray(sequence.encode())
+    if hits is None:
+        hits = scanner.scan(buffer)
+
+    mutations, unresolved = [], []
+    for position, site in hits:
+        if buffer[position : position + len(site)] != site.encode():
+            continue
+        mutation = recode_site(buffer, position, site, table, scanner, maximum)
+        if mutation is None:
+            unresolved.append((position, site))
+        else:
+            mutations.append(mutation)
+
+    return RecodingResult(buffer.decode(), mutations, unresolved)
+
+
+def remove_cutsites(sequence, table, sites, maximum=False):
+    """Removes recognition sites (both strands) from a CDS string"""
+    return recode_sites(sequence, table, get_scanner(sites), maximum=maximum)
@@ -0,0 +1,142 @@
+# cSpell: disable
+import os
+import sys
+import json
+import time
+import subprocess
+from collections import defaultdict
+import click
+import numpy
+from flask.cli import AppGroup
+from seqflask.utils import GlobalVariables
+from seqflask.tables import codon_tables, make_codon_table
+from seqflask.plots.utils import render_plot
+
+startup_cli = AppGroup("startup", help="Inspect and warm up application startup.")
+
+_MARKER = "-- warm-up --\n"
+
+# Run in a fresh interpreter by `flask startup report`; the marker separates
+# imports of create_app from the ones warm_up pulls in
+_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+from seqflask import create_app
+app = create_app()
+steps = {"create_app": time.perf_counter() - start}
+if %(warm)r:
+    from seqflask.startup import warm_up
+    sys.stderr.write(%(marker)r)
+    steps.update(warm_up(app, force=True))
+print(json.dumps(steps))
+"""
+
+
+def warm_up(app, force=False):
+    """Loads the codon tables of the form organisms and draws one small plot, so
+    pandas, matplotlib and its font cache are ready. Called in the gunicorn
+    master (see gunicorn.conf.py), forked workers share all of it. Does nothing
+    unless STARTUP_WARM_UP is set or force is given. Returns seconds per step."""
+    steps = {}
+    if not (force or app.config.get("STARTUP_WARM_UP")):
+        return steps
+
+    start = time.perf_counter()
+    registry = codon_tables(app)
+    registry.prepare()
+    for taxid, _ in GlobalVariables.ORGANISM_CHOICES[: registry.maxsize]:
+        try:
+            registry.get(taxid)
+        except KeyError:
+            continue
+    steps["codon_tables"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    make_codon_table(numpy.ones(64))
+    steps["pandas"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render_plot([(numpy.zeros(8), "warm-up")], minmax=True, fmt="png")
+    steps["matplotlib"] = time.perf_counter() - start
+
+    return steps
+
+
+def parse_importtime(text):
+    """Parses `python -X importtime` output into (depth, module, self, cumulative)
+    tuples in microseconds; depth 0 are imports made by the program itself"""
+    rows = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        # One space, then two more per level of nesting
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(fields[0]), int(fields[1])))
+    return rows
+
+
+def import_summary(rows, number=15):
+    """Total import time, the slowest imports made by the program and the self
+    time of every top-level package, slowest first"""
+    depth = min((row[0] for row in rows), default=0)
+    total = sum(row[3] for row in rows if row[0] == depth)
+    imports = sorted(
+        ((row[1], row[3]) for row in rows if row[0] == depth),
+        key=lambda item: -item[1],
+    )
+    packages = defaultdict(int)
+    for _, name, own, _ in rows:
+        packages[name.split(".")[0]] += own
+    packages = sorted(packages.items(), key=lambda item: -item[1])
+    return total, imports[:number], packages[:number]
+
+
+def startup_report(warm=False):
+    """Starts the app in a fresh interpreter with import timing. Returns the
+    parsed imports of create_app, those of warm_up and the step timings."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            _PROBE % {"warm": warm, "marker": _MARKER},
+        ],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    startup, _, warming = process.stderr.partition(_MARKER)
+    steps = json.loads(process.stdout.strip().splitlines()[-1])
+    return parse_importtime(startup), parse_importtime(warming), steps
+
+
+def _echo_summary(title, rows, number):
+    total, imports, packages = import_summary(rows, number)
+    click.echo(f"{title}: {total / 1e6:.3f} s")
+    click.echo("  Slowest imports (cumulative)")
+    for name, cumulative in imports:
+        click.echo(f"    {cumulative / 1e3:9.1f} ms  {name}")
+    click.echo("  Packages (self)")
+    for name, own in packages:
+        click.echo(f"    {own / 1e3:9.1f} ms  {name}")
+
+
+@startup_cli.command("report")
+@click.option("-n", "--number", default=15, help="Rows per listing.")
+@click.option("--warm-up", "warm", is_flag=True, help="Also time warm_up.")
+def report_command(number, warm):
+    """Show where startup time goes"""
+    startup, warming, steps = startup_report(warm=warm)
+    _echo_summary("Imports of create_app", startup, number)
+    if warm:
+        _echo_summary("Imports of warm_up", warming, number)
+    click.echo("Steps")
+    for step, seconds in steps.items():
+        click.echo(f"    {seconds * 1e3:9.1f} ms  {step}")
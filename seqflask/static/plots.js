@@ -0,0 +1,89 @@
+// Draws codon usage plots into <canvas class="codon-plot">; the series are
+// inlined in the page as the JSON script named by the canvas' data-plot
+(function () {
+  "use strict";
+
+  var PANEL_HEIGHT = 200;
+  var MARGIN = { left: 70, right: 20, top: 30, bottom: 35 };
+
+  function drawPanel(ctx, panel, minmax, top, width, length) {
+    var height = PANEL_HEIGHT - MARGIN.top - MARGIN.bottom;
+    var plotWidth = width - MARGIN.left - MARGIN.right;
+    var values = panel.values;
+    var yMin = minmax ? -100 : 0;
+    var yMax = minmax ? 100 : Math.max.apply(null, values.concat([1]));
+    var x = function (i) { return MARGIN.left + ((i + 4) / (length + 8)) * plotWidth; };
+    var y = function (v) { return top + MARGIN.top + (1 - (v - yMin) / (yMax - yMin)) * height; };
+
+    ctx.fillStyle = "#333333";
+    ctx.font = "14px sans-serif";
+    ctx.textAlign = "center";
+    ctx.fillText(panel.title.replace(/\$/g, ""), MARGIN.left + plotWidth / 2, top + 20);
+
+    ctx.strokeStyle = "#333333";
+    ctx.lineWidth = 1;
+    ctx.strokeRect(MARGIN.left, top + MARGIN.top, plotWidth, height);
+
+    ctx.font = "11px sans-serif";
+    ctx.textAlign = "right";
+    [yMin, (yMin + yMax) / 2, yMax].forEach(function (tick) {
+      ctx.fillText(Math.round(tick * 100) / 100, MARGIN.left - 6, y(tick) + 4);
+    });
+
+    if (minmax) {
+      // Fill above zero in C0 and below zero in C2 like the exported images
+      [["rgba(31, 119, 180, 0.5)", 1], ["rgba(44, 160, 44, 0.5)", -1]].forEach(function (fill) {
+        ctx.fillStyle = fill[0];
+        ctx.beginPath();
+        ctx.moveTo(x(0), y(0));
+        values.forEach(function (v, i) {
+          ctx.lineTo(x(i), y(fill[1] * v > 0 ? v : 0));
+        });
+        ctx.lineTo(x(values.length - 1), y(0));
+        ctx.closePath();
+        ctx.fill();
+      });
+      ctx.beginPath();
+      ctx.moveTo(x(-4), y(0));
+      ctx.lineTo(x(length + 4), y(0));
+      ctx.stroke();
+    }
+
+    ctx.strokeStyle = "rgba(31, 119, 180, 0.8)";
+    ctx.beginPath();
+    values.forEach(function (v, i) {
+      if (i === 0) {
+        ctx.moveTo(x(i), y(v));
+      } else {
+        ctx.lineTo(x(i), y(v));
+      }
+    });
+    ctx.stroke();
+  }
+
+  function draw(canvas, plot) {
+    var ratio = window.devicePixelRatio || 1;
+    var width = canvas.parentElement.clientWidth;
+    var height = PANEL_HEIGHT * plot.panels.length;
+    var length = Math.max.apply(null, plot.panels.map(function (p) { return p.values.length; }));
+    var ctx = canvas.getContext("2d");
+
+    canvas.width = width * ratio;
+    canvas.height = height * ratio;
+    canvas.style.width = width + "px";
+    canvas.style.height = height + "px";
+    ctx.scale(ratio, ratio);
+
+    plot.panels.forEach(function (panel, n) {
+      drawPanel(ctx, panel, plot.minmax, n * PANEL_HEIGHT, width, length);
+    });
+  }
+
+  document.querySelectorAll("canvas.codon-plot").forEach(function (canvas) {
+    var data = document.getElementById(canvas.dataset.plot);
+    var plot = data && JSON.parse(data.textContent);
+    if (plot) {
+      draw(canvas, plot);
+    }
+  });
+})();
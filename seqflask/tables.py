@@ -0,0 +1,451 @@
+# cSpell: disable
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from seqflask.utils import GlobalVariables
+from seqflask.encoding import encode_codons
+from seqflask.codondb import CodonDatabase, build_database
+
+AMINO_ACIDS = "".join(sorted(set(GlobalVariables.STANDARD_GENETIC_CODE)))
+
+_random = numpy.random.default_rng()
+
+tables_cli = AppGroup("tables", help="Codon usage tables")
+
+
+def _reseed():
+    global _random
+    _random = numpy.random.default_rng()
+
+
+os.register_at_fork(after_in_child=_reseed)
+
+
+class CodonTable:
+    """Array-backed codon usage table.
+
+    Every array has 64 entries in spsum codon order (GlobalVariables.CODONS).
+    Codons of the same amino acid are grouped by `order`, which follows the
+    (AA, Triplet) sort order of the DataFrame view."""
+
+    def __init__(self, codon_counts):
+        self.codons = list(GlobalVariables.CODONS)
+        self.codon_index = {codon: i for i, codon in enumerate(self.codons)}
+        self.counts = numpy.array(codon_counts, dtype=numpy.int64)
+        self.amino_index = numpy.array(
+            [AMINO_ACIDS.index(a) for a in GlobalVariables.STANDARD_GENETIC_CODE],
+            dtype=numpy.uint8,
+        )
+
+        self.order = numpy.lexsort((self.codons, self.amino_index))
+        grouped = self.amino_index[self.order]
+        self.starts = numpy.searchsorted(grouped, numpy.arange(len(AMINO_ACIDS)))
+        self.ends = numpy.searchsorted(
+            grouped, numpy.arange(len(AMINO_ACIDS)), side="right"
+        )
+
+        amino_totals = numpy.bincount(
+            self.amino_index, weights=self.counts, minlength=len(AMINO_ACIDS)
+        )
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            self.fraction = self.counts / amino_totals[self.amino_index]
+        self.frequency = self.counts / max(self.counts.sum(), 1) * 1000
+
+        # Per amino acid: most used codon, frequency statistics of synonymous
+        # codons and keys for sampling codons proportionally to their fraction
+        weights = numpy.nan_to_num(self.fraction)[self.order]
+        self.best = numpy.empty(len(AMINO_ACIDS), dtype=numpy.int64)
+        self.cumulative = numpy.empty(64)
+        self.synonym_max = numpy.empty(64)
+        self.synonym_min = numpy.empty(64)
+        self.synonym_mean = numpy.empty(64)
+        for amino, (start, end) in enumerate(zip(self.starts, self.ends)):
+            group = self.order[start:end]
+            self.best[amino] = group[numpy.argmax(weights[start:end])]
+            cumsum = numpy.cumsum(weights[start:end])
+            if cumsum[-1] <= 0:
+                cumsum = numpy.arange(1, end - start + 1, dtype=float)
+            self.cumulative[start:end] = amino + cumsum / cumsum[-1]
+            frequency = self.frequency[group]
+            self.synonym_max[group] = frequency.max()
+            self.synonym_min[group] = frequency.min()
+            self.synonym_mean[group] = frequency.mean()
+
+        self.residue_index = numpy.full(256, 255, dtype=numpy.uint8)
+        for amino, letter in enumerate(AMINO_ACIDS):
+            self.residue_index[ord(letter)] = amino
+        self.amino_bytes = numpy.frombuffer(
+            "".join(AMINO_ACIDS[a] for a in self.amino_index).encode() + b"?",
+            dtype=numpy.uint8,
+        )
+        self.codon_bytes = numpy.frombuffer(
+            "".join(self.codons + ["NNN"]).encode(), dtype=numpy.uint8
+        ).reshape(65, 3)
+
+        self.digest = hashlib.sha1(self.counts.tobytes()).hexdigest()
+        self._dataframe = None
+
+    def __eq__(self, other):
+        return isinstance(other, CodonTable) and self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    @classmethod
+    def from_dataframe(cls, table):
+        """Makes a CodonTable out of a DataFrame made by `make_codon_table`"""
+        numbers = table.reset_index().set_index("Triplet")["Number"]
+        return cls([int(numbers[codon]) for codon in GlobalVariables.CODONS])
+
+    @classmethod
+    def coerce(cls, table):
+        """Returns table as a CodonTable"""
+        if isinstance(table, cls):
+            return table
+        return cls.from_dataframe(table)
+
+    @property
+    def dataframe(self):
+        """DataFrame view of the table indexed by (AA, Triplet)"""
+        if self._dataframe is None:
+            self._dataframe = make_codon_table(self.counts)
+        return self._dataframe
+
+    def amino(self, triplet):
+        """Returns the amino acid encoded by a triplet or None"""
+        index = self.codon_index.get(triplet)
+        if index is None:
+            return None
+        return AMINO_ACIDS[self.amino_index[index]]
+
+    def synonyms(self, triplet):
+        """Returns all codons encoding the same amino acid as triplet"""
+        amino = self.amino_index[self.codon_index[triplet]]
+        return [
+            self.codons[i] for i in self.order[self.starts[amino] : self.ends[amino]]
+        ]
+
+    def get_codon(self, amino, maximum=False, skip=()):
+        """Returns a "locally-optimized" codon. Locally-optimized = mimics the
+        codon frequency in the table. Maximum uses the most common codon.
+        Returns None if every codon of the amino acid is skipped."""
+        amino = AMINO_ACIDS.index(amino)
+        group = [
+            i
+            for i in self.order[self.starts[amino] : self.ends[amino]]
+            if self.codons[i] not in skip
+        ]
+        if not group:
+            return None
+        weights = numpy.nan_to_num(self.fraction[group])
+        # Deterministic allocation of codon based on the highest frequency
+        if maximum:
+            return self.codons[group[numpy.argmax(weights)]]
+        # Stochastic allocation of codon
+        cumsum = numpy.cumsum(weights)
+        if cumsum[-1] <= 0:
+            return self.codons[group[0]]
+
+        return self.codons[group[numpy.sum(cumsum / cumsum[-1] < _random.random())]]
+
+    def translate(self, sequence):
+        """Returns the protein string encoded by a DNA sequence; unknown codons
+        become ?"""
+        return self.translate_codons(encode_codons(sequence))
+
+    def translate_codons(self, codons):
+        """Returns the protein string for an array of codon indices"""
+        return self.amino_bytes[codons].tobytes().decode()
+
+    def reverse_translate(self, protein, maximum=False):
+        """Returns a DNA string encoding protein; unknown residues become NNN"""
+        residues = self.residue_index[numpy.frombuffer(protein.encode(), numpy.uint8)]
+        known = residues != 255
+        indices = numpy.full(len(residues), 64)
+
+        if maximum:
+            indices[known] = self.best[residues[known]]
+        else:
+            aminos = residues[known]
+            position = numpy.searchsorted(
+                self.cumulative, aminos + _random.random(len(aminos))
+            )
+            position = numpy.minimum(position, self.ends[aminos] - 1)
+            indices[known] = self.order[position]
+
+        return self.codon_bytes[indices].tobytes().decode()
+
+
+class CodonTableRegistry:
+    """Process-wide index of every organism in the spsum files.
+
+    Organisms are read from the binary database (see seqflask.codondb) when it
+    is at least as new as the spsum files. Otherwise the spsum files are scanned
+    once and only the byte offset of every organism is kept. Derived tables are
+    built on first use and kept in a bounded LRU, which is invalidated whenever
+    the modification time of a file changes."""
+
+    def __init__(self, main_path, custom_path, maxsize=64, database=None):
+        self.paths = {False: main_path, True: custom_path}
+        self.database = database
+        self.maxsize = maxsize
+        self.stats = {"loads": 0, "hits": 0, "misses": 0}
+        self._indexes = {}
+        self._database = None
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(
+            os.path.join(app.root_path, "data/codon_usage.spsum"),
+            os.path.join(app.root_path, "data/custom_table.spsum"),
+            maxsize=app.config.get("CODON_TABLE_CACHE_SIZE", 64),
+            database=app.config.get("CODON_DATABASE")
+            or os.path.join(app.root_path, "data/codon_usage.db"),
+        )
+
+    def __len__(self):
+        database = self.codon_database()
+        if database is not None:
+            return len(database)
+        return sum(len(self.index(custom)) for custom in self.paths)
+
+    def __contains__(self, taxonomy_id):
+        return self.locate(taxonomy_id) is not None
+
+    def codon_database(self):
+        """Returns the mapped binary database or None if there is none or it is
+        older than one of the spsum files"""
+        if self.database is None:
+            return None
+        try:
+            mtime = os.stat(self.database).st_mtime_ns
+        except OSError:
+            return None
+        for path in self.paths.values():
+            try:
+                if os.stat(path).st_mtime_ns > mtime:
+                    return None
+            except OSError:
+                pass
+
+        with self._lock:
+            if self._database is None or self._database.mtime != mtime:
+                self._database = CodonDatabase(self.database)
+                self._cache.clear()
+            return self._database
+
+    def index(self, custom=False):
+        """Returns {taxid: (offset, species)} for one spsum file, rebuilding it if
+        the file changed on disk"""
+        path = self.paths[custom]
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            cached = self._indexes.get(custom)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+            organisms = OrderedDict()
+            if mtime is not None:
+                with open(path, "rb") as handle:
+                    offset = 0
+                    for header in handle:
+                        counts = handle.readline()
+                        if header.strip() and counts:
+                            taxid, species = header.decode().strip().split(":")[:2]
+                            organisms.setdefault(taxid, (offset + len(header), species))
+                        offset += len(header) + len(counts)
+
+            self._indexes[custom] = (mtime, organisms)
+            for key in [key for key in self._cache if key[0] == custom]:
+                del self._cache[key]
+
+            return organisms
+
+    def organisms(self):
+        """Returns a list of (taxid, species) tuples for every indexed organism"""
+        database = self.codon_database()
+        if database is not None:
+            return [
+                (database.key(row).decode(), database.species(row))
+                for source in (0, 1)
+                for row in database.rows(source)
+            ]
+
+        return [
+            (taxid, entry[1])
+            for custom in self.paths
+            for taxid, entry in self.index(custom).items()
+        ]
+
+    def locate(self, taxonomy_id=None, custom=False):
+        """Returns the (custom, taxid) key of an organism or None if it is unknown.
+        Regular lookups fall back to the custom table."""
+        database = self.codon_database()
+        for source in (True,) if custom else (False, True):
+            if database is not None:
+                if taxonomy_id is None:
+                    row = next(database.rows(int(source)), None)
+                else:
+                    row = database.find(taxonomy_id, int(source))
+                if row is not None:
+                    return source, database.key(row).decode()
+                continue
+
+            organisms = self.index(source)
+            if taxonomy_id is None:
+                if organisms:
+                    return source, next(iter(organisms))
+            elif str(taxonomy_id) in organisms:
+                return source, str(taxonomy_id)
+        return None
+
+    def get(self, taxonomy_id=None, custom=False):
+        """Returns (table, species) for a given organism"""
+        key = self.locate(taxonomy_id, custom=custom)
+        if key is None:
+            raise KeyError(f"Unknown taxonomy id: {taxonomy_id}")
+
+        with self._lock:
+            if key in self._cache:
+                self.stats["hits"] += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self.stats["misses"] += 1
+
+        entry = self.load(*key)
+
+        with self._lock:
+            self._cache[key] = entry
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        return entry
+
+    def load(self, custom, taxid):
+        """Reads codon counts of a single organism from disk and derives the table"""
+        database = self.codon_database()
+        if database is not None:
+            row = database.find(taxid, int(custom))
+            codon_counts = database.counts[row]
+            species = database.species(row)
+        else:
+            offset, species = self.index(custom)[taxid]
+            with open(self.paths[custom], "rb") as handle:
+                handle.seek(offset)
+                codon_counts = [int(x) for x in handle.readline().split()]
+
+        with self._lock:
+            self.stats["loads"] += 1
+
+        return CodonTable(codon_counts), species
+
+    def prepare(self):
+        """Opens the binary database or indexes the spsum files"""
+        if self.codon_database() is None:
+            for custom in self.paths:
+                self.index(custom)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._database = None
+            self._cache.clear()
+
+
+def make_codon_table(codon_counts):
+    """Makes a codon usage table from 64 codon counts in spsum order"""
+    # pandas is only needed for DataFrame views, so it loads on first use
+    from pandas import DataFrame
+
+    table = DataFrame(
+        {
+            "Triplet": GlobalVariables.CODONS,
+            "AA": GlobalVariables.STANDARD_GENETIC_CODE,
+            "Number": codon_counts,
+        }
+    )
+    table.set_index(["AA", "Triplet"], inplace=True)
+    table.sort_index(inplace=True)
+    total = table["Number"].sum()
+
+    table["Fraction"] = table["Number"] / table.groupby(level="AA")["Number"].transform(
+        "sum"
+    )
+    table["Frequency"] = table["Number"] / total * 1000
+
+    return table
+
+
+def codon_tables(app=None):
+    """Returns codon table registry of the (current) app"""
+    app = app or current_app
+    if "codon_tables" not in app.extensions:
+        app.extensions["codon_tables"] = CodonTableRegistry.from_app(app)
+    return app.extensions["codon_tables"]
+
+
+def load_codon_table(taxonomy_id=None, custom=False, return_name=False):
+    """Load a codon table based on the organism's species ID"""
+    table, species = codon_tables().get(taxonomy_id, custom=custom)
+
+    if return_name:
+        return table, species
+
+    return table
+
+
+@tables_cli.command("count")
+@click.argument(
+    "fasta", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+@click.option("-i", "--taxid", required=True, help="NCBI TaxID of the organism.")
+@click.option("-n", "--name", "species", required=True, help="Name of the organism.")
+@click.option(
+    "-o", "--output", help="spsum file to append to (default: custom table of the app)."
+)
+@click.option("-w", "--workers", type=int, help="Counting processes (default: CPUs).")
+def count_command(fasta, taxid, species, output, workers):
+    """Count codons of CDS FASTA files (plain, .gz or .bz2) into a codon table"""
+    from seqflask.counting import append_spsum, count_fasta
+
+    registry = codon_tables()
+    if output is None:
+        output = registry.paths[True]
+        if registry.locate(taxid, custom=True) is not None:
+            raise click.UsageError(f"Taxonomy ID {taxid} is already in {output}")
+
+    result = count_fasta(fasta, workers=workers)
+    if result.genes < 100:
+        click.echo(f"WARNING: Number of genes < 100 ({result.genes})", err=True)
+    if result.partial:
+        click.echo(
+            f"Not used: {len(result.partial)} partial sequences not divisible by "
+            "complete codons",
+            err=True,
+        )
+    append_spsum(output, taxid, species, result.counts, result.genes)
+    click.echo(f"Counted {int(result.counts.sum())} codons of {result.genes} genes")
+
+    if output == registry.paths[True] and os.path.exists(registry.database):
+        build_database(registry.database, *registry.paths.values())
+        click.echo(f"Rebuilt {registry.database}")
+
+
+@tables_cli.command("build")
+def build_command():
+    """Build the binary codon usage database from the spsum files"""
+    registry = codon_tables()
+    count = build_database(registry.database, *registry.paths.values())
+    registry.clear()
+    click.echo(f"Wrote {count} organisms to {registry.database}")
@@ -0,0 +1,198 @@
+# cSpell: disable
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+DEFAULT_BASE_URL = "https://rest.uniprot.org"
+
+# Accessions per batched request; UniProt accepts up to 1000
+BATCH_SIZE = 100
+
+# UniProtKB accession, optionally with an isoform number
+ACCESSION = re.compile(
+    r"^(?:[OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})"
+    r"(?:-[0-9]+)?$"
+)
+
+
+class UniProtError(Exception):
+    """UniProt could not be reached or answered with an error"""
+
+
+def parse_accessions(text):
+    """Upper-cased accessions of a comma or whitespace separated list, without
+    duplicates, in the order given"""
+    accessions = []
+    for accession in re.split(r"[\s,;]+", text.upper()):
+        if accession and accession not in accessions:
+            accessions.append(accession)
+    return accessions
+
+
+def split_entries(fasta):
+    """Maps the accession of every record of a UniProt FASTA response (the
+    second field of headers like >sp|P69905|HBA_HUMAN) to its text"""
+    entries = {}
+    for record in fasta.split("\n>"):
+        record = record.strip()
+        if not record:
+            continue
+        if not record.startswith(">"):
+            record = ">" + record
+        fields = record.split("\n", 1)[0].split("|")
+        accession = fields[1] if len(fields) > 2 else fields[0][1:].split()[0]
+        entries[accession.upper()] = record + "\n"
+    return entries
+
+
+class UniProtClient:
+    """Fetches UniProtKB entries as FASTA.
+
+    Entries are looked up in an on-disk cache (one file per accession, valid
+    for ttl seconds) first. The rest are requested in batches of batch_size
+    accessions over one pooled HTTP session, with up to workers batches in
+    flight, so a form with 50 accessions costs a single round trip."""
+
+    def __init__(
+        self,
+        base_url=DEFAULT_BASE_URL,
+        cache_dir=None,
+        ttl=7 * 24 * 3600,
+        timeout=10.0,
+        workers=4,
+        batch_size=BATCH_SIZE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.timeout = timeout
+        self.workers = workers
+        self.batch_size = batch_size
+        self.stats = {"hits": 0, "misses": 0, "requests": 0}
+        self._session = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(
+            app.config.get("UNIPROT_BASE_URL") or DEFAULT_BASE_URL,
+            cache_dir=app.config.get("UNIPROT_CACHE_DIR")
+            or os.path.join(app.instance_path, "uniprot"),
+            ttl=app.config.get("UNIPROT_CACHE_TTL", 7 * 24 * 3600),
+            timeout=app.config.get("UNIPROT_TIMEOUT", 10.0),
+            workers=app.config.get("UNIPROT_WORKERS", 4),
+        )
+
+    def session(self):
+        """Shared requests session with a connection pool for every worker"""
+        with self._lock:
+            if self._session is None:
+                # requests is only needed once UniProt is asked for something
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                self._session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=max(self.workers, 1)
+                )
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def _path(self, accession):
+        """Cache file of a well-formed accession, always inside cache_dir"""
+        if not ACCESSION.match(accession):
+            raise ValueError(f"Malformed UniProt accession: {accession!r}")
+        directory = os.path.realpath(self.cache_dir)
+        path = os.path.realpath(os.path.join(directory, f"{accession}.fasta"))
+        if os.path.dirname(path) != directory:
+            raise ValueError(f"Cache path outside of {directory}: {accession!r}")
+        return path
+
+    def cached(self, accession):
+        """Returns the cached FASTA of an accession, or None if it is missing or
+        older than ttl"""
+        if not self.cache_dir:
+            return None
+        path = self._path(accession)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as handle:
+                return handle.read()
+        except OSError:
+            return None
+
+    def store(self, accession, fasta):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(accession)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "w") as handle:
+            handle.write(fasta)
+        os.replace(temporary, path)
+
+    def request(self, accessions):
+        """One batched query; returns {accession: fasta} of the entries found"""
+        import requests
+
+        with self._lock:
+            self.stats["requests"] += 1
+        try:
+            response = self.session().get(
+                f"{self.base_url}/uniprotkb/accessions",
+                params={"accessions": ",".join(accessions), "format": "fasta"},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise UniProtError(f"UniProt request failed: {e}") from e
+        return split_entries(response.text)
+
+    def fetch(self, accessions):
+        """Returns ({accession: fasta}, [accessions not found]). Malformed
+        accessions are never sent and count as not found."""
+        found, wanted = {}, []
+        for accession in accessions:
+            if not ACCESSION.match(accession):
+                continue
+            fasta = self.cached(accession)
+            if fasta is not None:
+                found[accession] = fasta
+            else:
+                wanted.append(accession)
+        with self._lock:
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(accessions) - len(found)
+
+        batches = [
+            wanted[i : i + self.batch_size]
+            for i in range(0, len(wanted), self.batch_size)
+        ]
+        if len(batches) > 1 and self.workers > 1:
+            with ThreadPoolExecutor(min(self.workers, len(batches))) as pool:
+                results = list(pool.map(self.request, batches))
+        else:
+            results = [self.request(batch) for batch in batches]
+
+        requested = set(wanted)
+        for entries in results:
+            for accession, fasta in entries.items():
+                if accession in requested:
+                    found[accession] = fasta
+                    self.store(accession, fasta)
+
+        missing = [accession for accession in accessions if accession not in found]
+        return found, missing
+
+
+def uniprot_client(app=None):
+    """Returns the UniProt client of the (current) app"""
+    app = app or current_app
+    if "uniprot" not in app.extensions:
+        app.extensions["uniprot"] = UniProtClient.from_app(app)
+    return app.extensions["uniprot"]
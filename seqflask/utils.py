@@ -1,8 +1,7 @@
 # cSpell: disable
-import os
-from random import random
-from pandas import DataFrame
-from flask import current_app
+import io
+import bz2
+import gzip
 
 
 class GlobalVariables:
@@ -274,99 +273,76 @@ class GlobalVariables:
     }
 
 
-def clean_old_plots():
-    for file in os.scandir(os.path.join(current_app.root_path, "static/images/")):
-        if file.name[-4:] == ".png":
-            os.remove(file.path)
+class FastaError(ValueError):
+    """Malformed FASTA input"""
 
+    def __init__(self, message, line_number=None):
+        if line_number is not None:
+            message = f"Line {line_number}: {message}"
+        super().__init__(message)
+        self.line_number = line_number
 
-def make_plot_path(n):
-    return f"{os.path.join(current_app.root_path, f'static/images/plot{n+1}.png')}"
 
+def open_fasta(handle, binary=False):
+    """Returns a text (or binary) stream for a str, bytes or file-like FASTA.
+    Gzip and bz2 input is recognized by its magic bytes and decompressed on the
+    fly."""
+    if isinstance(handle, str):
+        if not binary:
+            return io.StringIO(handle)
+        handle = handle.encode()
+    if isinstance(handle, (bytes, bytearray, memoryview)):
+        handle = io.BytesIO(handle)
+    if isinstance(handle, io.TextIOBase):
+        if not binary:
+            return handle
+        handle = handle.buffer
 
-def fasta_parser(handle):
-    """Parser for fasta sequences."""
-    stream = handle.split("\n")
-    sequences = []
+    if not hasattr(handle, "peek"):
+        handle = io.BufferedReader(handle)
+    magic = handle.peek(3)[:3]
+    if magic[:2] == b"\x1f\x8b":
+        handle = gzip.GzipFile(fileobj=handle)
+    elif magic == b"BZh":
+        handle = bz2.BZ2File(handle)
 
-    for line in stream:
-        if line.strip()[0] == ">":
-            seq_name = line.strip()[1:71]
-            break
-    else:
-        return sequences
+    if binary:
+        return handle
+    return io.TextIOWrapper(handle, encoding="utf-8", errors="replace")
 
-    temp = []
-    for line in stream:
-        if line and line.strip()[0] == ">":
-            if temp:
-                sequences.append((seq_name, "".join(temp)))
-            seq_name = line.strip()[1:71]
-            temp = []
+
+def iter_fasta(handle):
+    """Yields (name, sequence) records of a FASTA one at a time, so memory use is
+    bounded by the longest record. Blank lines and ";" comments are skipped.
+    Raises FastaError with the line number of malformed input."""
+    name, parts = None, []
+    for line_number, line in enumerate(open_fasta(handle), 1):
+        line = line.strip()
+        if not line or line[0] == ";":
             continue
+        if line[0] == ">":
+            if name is not None:
+                yield name, "".join(parts).upper()
+            name, parts = line[1:71], []
+        elif name is None:
+            raise FastaError("sequence data before the first header", line_number)
+        elif not line.isprintable():
+            raise FastaError("binary data in sequence", line_number)
+        elif " " in line or "\t" in line:
+            parts.append("".join(line.split()))
         else:
-            temp.append(line.strip().upper())
-    else:
-        sequences.append((seq_name, "".join(temp)))
-
-    return sequences
-
-
-def sequence_match(string, search):
-    """Returns TRUE if sequence matches condition in search"""
-    return not bool(search(string))
-
-
-def load_codon_table(taxonomy_id=None, custom=False, return_name=False):
-    """Load a codon table based on the organism's species ID"""
-    if custom:
-        handle = os.path.join(current_app.root_path, "data/custom_table.spsum")
-    else:
-        handle = os.path.join(current_app.root_path, "data/codon_usage.spsum")
+            parts.append(line)
 
-    with open(handle) as h:
-        for header in h:
-            codon_counts = h.readline()
+    if name is not None:
+        yield name, "".join(parts).upper()
 
-            taxid, species = header.strip().split(":")[:2]
-
-            if taxonomy_id:
-                taxonomy_id = str(taxonomy_id)
-
-            if taxonomy_id and taxonomy_id != taxid:
-                continue
-
-            table = list(
-                zip(
-                    GlobalVariables.CODONS,
-                    GlobalVariables.STANDARD_GENETIC_CODE,
-                    [int(x) for x in codon_counts.split()],
-                )
-            )
-            table = DataFrame(table, columns=["Triplet", "AA", "Number"])
-            table.set_index(["AA", "Triplet"], inplace=True)
-            table.sort_index(inplace=True)
-            total = sum(table["Number"])
-
-            table["Fraction"] = table.groupby("AA").transform(lambda x: x / x.sum())
-            table["Frequency"] = table["Number"] / total * 1000
-            break
-
-    if return_name:
-        return table, species
-
-    return table
 
+def fasta_parser(handle):
+    """Parser for fasta sequences."""
+    return list(iter_fasta(handle))
 
-def get_codon(codons, maximum=False, recode=False, skip=[]):
-    """Returns a "locally-optimized" codon. Locally-optimized = mimics the
-    codon frequency in the table. Maximum uses the most common codon."""
-    if recode:
-        codons = codons.loc[[cod for cod in codons.index if cod not in skip]]
-    # Deterministic allocation of codon based on the highest frequency
-    if maximum:
-        return codons.Fraction.idxmax()
-    # Stochastic allocation of codon
-    x = codons.Fraction.cumsum() / codons.Fraction.cumsum().max() < random()
 
-    return codons.iloc[x.sum()].name
+def only_characters(string, allowed):
+    """Returns True if string consists of allowed (bytes) characters only. One
+    table-driven pass: bytes.translate deletes the allowed characters."""
+    return string.isascii() and not string.encode().translate(None, allowed)
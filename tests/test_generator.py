@@ -0,0 +1,25 @@
+# cSpell: disable
+import os
+import pytest
+from seqflask.generator.utils import random_dna
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_processes_differ():
+    """Children forked from one parent draw their own random DNA"""
+    random_dna(100)
+    sequences = []
+    for _ in range(2):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            os.write(write, random_dna(200).encode())
+            os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as handle:
+            sequences.append(handle.read())
+        os.waitpid(pid, 0)
+
+    assert len(sequences[0]) == 200
+    assert sequences[0] != sequences[1]
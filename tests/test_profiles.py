@@ -0,0 +1,22 @@
+# cSpell: disable
+import numpy
+import pytest
+from seqflask.tables import CodonTable
+from seqflask.profiles import codon_profile
+
+
+@pytest.fixture
+def table():
+    return CodonTable(numpy.random.default_rng(3).integers(1, 5000, 64))
+
+
+@pytest.mark.parametrize("window", [1, 2, 3])
+def test_single_codon_amino_acids_are_zero(table, window):
+    """Windows of Met and Trp codons only sit at the average, after a varied
+    prefix that leaves rounding errors in the prefix sums"""
+    rng = numpy.random.default_rng(window)
+    prefix = "".join(rng.choice(["GCT", "CTG", "AAA", "GGC", "TCA"], 50))
+    profile = codon_profile(prefix + "ATGTGGATGATGTGGTGGATG", table, window=window)
+
+    assert numpy.isfinite(profile).all()
+    assert (profile[-(7 - window + 1) :] == 0).all()